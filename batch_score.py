@@ -0,0 +1,235 @@
+# batch_score.py
+# Headless trip scoring: streams a CSV/Parquet file in chunks through
+# prepare_input_frame -> predict_energy_consumption_batch -> range metrics and
+# writes consumption, range and CO2 columns incrementally.
+#
+# Usage:
+#   python batch_score.py trips.csv scored.csv
+#   python batch_score.py trips.parquet scored.parquet --map Speed_kmh=avg_speed --workers 4
+#   python batch_score.py trips.csv scored.csv --resume
+#   python batch_score.py trips.csv scored.csv --processes --workers 8
+#   python batch_score.py fleet.csv scored.csv --profiles vehicle_profiles.csv --map vehicle_profile=model_code
+#
+# Rows are matched to vehicle profiles (battery, weight, tire pressure, scaling,
+# clamp bounds, emission factor) through their vehicle_profile column; rows
+# without one use the default profile.
+#
+# Rows with a missing or non-numeric input value are not scored: their output
+# columns are left empty and the run reports how many there were.
+#
+# CSV output is a single file. Parquet output is a directory of part files
+# (one per chunk), readable with pandas.read_parquet(directory).
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import common_functions as cf
+
+OUTPUT_COLUMNS = ['consumption_kwh_per_km', 'predicted_range_km', 'co2_saved_kg']
+PROFILE_COLUMN = 'vehicle_profile'
+
+
+def iter_input_chunks(path, chunk_size):
+    """Yields DataFrames of at most chunk_size rows without loading the whole file."""
+    if path.endswith('.parquet'):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Reading Parquet needs pyarrow: pip install pyarrow")
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+def score_chunk(chunk, model, column_map=None, profiles=None):
+    """
+    Adds OUTPUT_COLUMNS to a chunk of trips, each scored with its vehicle's
+    profile. Rows with a missing or non-numeric input get empty (NaN) outputs
+    instead of being scored with made-up values.
+    """
+    profile = None
+    profile_column = (column_map or {}).get(PROFILE_COLUMN, PROFILE_COLUMN)
+    if profiles is not None and profile_column in chunk.columns:
+        profile = profiles.lookup(chunk[profile_column])
+
+    records = cf.prepare_input_frame(chunk, column_map,
+                                     cf.VehicleProfileRegistry.input_defaults(profile) if profile is not None else None)
+    valid = ~cf.invalid_input_rows(records)
+    valid_profile = {field: values[valid] for field, values in profile.items()} if profile is not None else None
+
+    scored = chunk.copy()
+    for column in OUTPUT_COLUMNS:
+        scored[column] = np.nan
+
+    if valid.any():
+        consumption = cf.predict_energy_consumption_batch(records[valid], model, valid_profile)
+        predicted_range, co2_saved_kg = cf.calculate_range_metrics_batch(
+            consumption, records.loc[valid, 'Battery_State_%'].to_numpy(), valid_profile)
+        scored.loc[valid, 'consumption_kwh_per_km'] = consumption
+        scored.loc[valid, 'predicted_range_km'] = predicted_range
+        scored.loc[valid, 'co2_saved_kg'] = co2_saved_kg
+    return scored
+
+
+def score_chunk_in_worker(chunk, column_map=None, profile_path=cf.VEHICLE_PROFILE_PATH):
+    """Process-pool task: scores with the model loaded by cf.init_scoring_worker."""
+    return score_chunk(chunk, cf.get_worker_model(), column_map, cf.get_vehicle_profiles(profile_path))
+
+
+class ChunkWriter:
+    """
+    Writes scored chunks in order and records progress after each one, so an
+    interrupted run can resume from the last completed chunk.
+    """
+
+    def __init__(self, output_path, chunk_size, resume=False):
+        self.output_path = output_path
+        self.progress_path = output_path.rstrip('/') + '.progress.json'
+        self.is_parquet = output_path.endswith('.parquet')
+        self.progress = {'chunk_size': chunk_size, 'completed_chunks': 0, 'rows': 0, 'csv_bytes': 0}
+
+        if resume and os.path.exists(self.progress_path):
+            with open(self.progress_path) as f:
+                saved = json.load(f)
+            if saved['chunk_size'] != chunk_size:
+                raise SystemExit(f"Cannot resume: previous run used --chunk-size {saved['chunk_size']}")
+            self.progress = saved
+            # Drop anything written after the last recorded chunk
+            if self.is_parquet:
+                self.remove_parts(from_chunk=saved['completed_chunks'])
+            elif os.path.exists(output_path):
+                with open(output_path, 'r+b') as f:
+                    f.truncate(saved['csv_bytes'])
+        else:
+            # A fresh run starts from an empty output and no progress
+            if os.path.exists(self.progress_path):
+                os.remove(self.progress_path)
+            if self.is_parquet:
+                os.makedirs(output_path, exist_ok=True)
+                self.remove_parts()
+            elif os.path.exists(output_path):
+                os.remove(output_path)
+
+    def remove_parts(self, from_chunk=0):
+        """Deletes part-NNNNNN.parquet files numbered from_chunk and up."""
+        if not os.path.isdir(self.output_path):
+            return
+        for name in os.listdir(self.output_path):
+            number = name[len('part-'):-len('.parquet')]
+            if name.startswith('part-') and name.endswith('.parquet') and number.isdigit() and int(number) >= from_chunk:
+                os.remove(os.path.join(self.output_path, name))
+
+    @property
+    def completed_chunks(self):
+        return self.progress['completed_chunks']
+
+    def write(self, scored):
+        chunk_id = self.progress['completed_chunks']
+        if self.is_parquet:
+            scored.to_parquet(os.path.join(self.output_path, f"part-{chunk_id:06d}.parquet"), index=False)
+        else:
+            scored.to_csv(self.output_path, mode='a', header=(chunk_id == 0), index=False)
+            self.progress['csv_bytes'] = os.path.getsize(self.output_path)
+
+        self.progress['completed_chunks'] += 1
+        self.progress['rows'] += len(scored)
+        with open(self.progress_path + '.tmp', 'w') as f:
+            json.dump(self.progress, f)
+        os.replace(self.progress_path + '.tmp', self.progress_path)
+
+
+def parse_column_map(pairs):
+    column_map = {}
+    for pair in pairs or []:
+        key, _, column = pair.partition('=')
+        if not column:
+            raise SystemExit(f"--map expects KEY=COLUMN, got {pair!r}")
+        column_map[key] = column
+    return column_map
+
+
+def run(input_path, output_path, chunk_size=50_000, workers=2, column_map=None, resume=False, model=None,
+        processes=False, profile_path=cf.VEHICLE_PROFILE_PATH):
+    """
+    Scores input_path into output_path; returns the number of rows scored in
+    this run. With processes=True chunks go to a process pool whose workers
+    each load the model once (memory-mapped when packaged); otherwise a
+    thread pool shares the in-process model.
+    """
+    if processes:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=cf.init_scoring_worker,
+                                   initargs=(cf.LOCAL_FILE_PATH, cf.PACKAGED_MODEL_DIR, cf.INFERENCE_BACKEND))
+        task, task_args = score_chunk_in_worker, (column_map, profile_path)
+    else:
+        model = model if model is not None else cf.load_model_artifact()
+        pool = ThreadPoolExecutor(max_workers=workers)
+        task, task_args = score_chunk, (model, column_map, cf.get_vehicle_profiles(profile_path))
+
+    writer = ChunkWriter(output_path, chunk_size, resume=resume)
+    skip = writer.completed_chunks
+
+    start = time.perf_counter()
+    rows_this_run = 0
+    invalid_rows = 0
+    pending = []
+
+    # At most 2 chunks per worker are in memory, regardless of file size
+    with pool:
+        for chunk_id, chunk in enumerate(iter_input_chunks(input_path, chunk_size)):
+            if chunk_id < skip:
+                continue
+            pending.append(pool.submit(task, chunk, *task_args))
+
+            while pending and (len(pending) >= 2 * workers or pending[0].done()):
+                scored = pending.pop(0).result()
+                writer.write(scored)
+                rows_this_run += len(scored)
+                invalid_rows += int(scored['consumption_kwh_per_km'].isna().sum())
+                elapsed = time.perf_counter() - start
+                print(f"chunk {writer.completed_chunks}: {writer.progress['rows']} rows total, "
+                      f"{rows_this_run / elapsed:,.0f} rows/s", file=sys.stderr)
+
+        for future in pending:
+            scored = future.result()
+            writer.write(scored)
+            rows_this_run += len(scored)
+            invalid_rows += int(scored['consumption_kwh_per_km'].isna().sum())
+
+    elapsed = time.perf_counter() - start
+    print(f"Done: {rows_this_run} rows in {elapsed:.1f} s "
+          f"({rows_this_run / elapsed if elapsed else 0:,.0f} rows/s) -> {output_path}", file=sys.stderr)
+    if invalid_rows:
+        print(f"Warning: {invalid_rows} rows had missing or non-numeric inputs; their output columns are empty",
+              file=sys.stderr)
+    return rows_this_run
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score historical trip segments with the EV range model.")
+    parser.add_argument('input', help="Input .csv or .parquet file")
+    parser.add_argument('output', help="Output .csv file or .parquet directory")
+    parser.add_argument('--chunk-size', type=int, default=50_000, help="Rows per chunk")
+    parser.add_argument('--workers', type=int, default=2, help="Chunks scored in parallel")
+    parser.add_argument('--map', action='append', metavar='KEY=COLUMN',
+                        help="Map a prepare_input key (e.g. Speed_kmh) to an input column; repeatable")
+    parser.add_argument('--resume', action='store_true', help="Continue after the last completed chunk")
+    parser.add_argument('--processes', action='store_true',
+                        help="Use a process pool (one model load per worker) instead of threads")
+    parser.add_argument('--profiles', default=cf.VEHICLE_PROFILE_PATH,
+                        help="Vehicle profile CSV, matched on the vehicle_profile column")
+    args = parser.parse_args()
+
+    run(args.input, args.output, args.chunk_size, args.workers, parse_column_map(args.map), args.resume,
+        processes=args.processes, profile_path=args.profiles)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/fixtures.py
+# Offline fixtures for the benchmarks: a small synthetic RandomForest with the
+# real FEATURE_NAMES, synthetic records/stations, and a local mock HTTP server
+# standing in for Nominatim and Overpass.
+
+import json
+import os
+import pickle
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common_functions as cf
+
+
+def synthetic_records(n_rows, seed=0):
+    """Random prepare_input records inside the dashboard slider ranges."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(cf.prepare_input(
+        speed=rng.uniform(20, 120, n_rows), temp=rng.uniform(-5, 45, n_rows),
+        mode=rng.integers(1, 4, n_rows), road=rng.integers(1, 4, n_rows), traffic=rng.integers(1, 4, n_rows),
+        slope=rng.uniform(-5, 5, n_rows), battery_state=rng.uniform(10, 100, n_rows),
+    ))
+
+
+def make_fixture_model(path, n_estimators=100, max_depth=14, n_samples=20_000, seed=0):
+    """
+    Trains a RandomForestRegressor on synthetic data shaped like the real
+    training set (raw consumption roughly 4-25, i.e. 0.07-0.45 kWh/km after
+    scaling) and pickles it to path.
+    """
+    from sklearn.ensemble import RandomForestRegressor
+
+    rng = np.random.default_rng(seed)
+    X = pd.DataFrame(cf.build_feature_matrix(synthetic_records(n_samples, seed).to_dict('records')),
+                     columns=cf.FEATURE_NAMES)
+    y = (5 + 0.1 * X['Speed_kmh'] + 0.8 * X['Slope_%'] + 2 * X['Driving_Mode_3'] - 1 * (1 - X['Driving_Mode_2'] - X['Driving_Mode_3'])
+         + 0.05 * (X['Temperature_C'] - 20).abs() + rng.normal(0, 0.3, n_samples))
+    model = RandomForestRegressor(n_estimators=n_estimators, max_depth=max_depth, random_state=seed).fit(X, y)
+    with open(path, 'wb') as f:
+        pickle.dump(model, f)
+    return model
+
+
+def synthetic_stations(n_stations, center=(21.25, 81.63), spread_deg=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Station_Name': [f"Station {i}" for i in range(n_stations)],
+        'lat': center[0] + rng.uniform(-spread_deg, spread_deg, n_stations),
+        'lon': center[1] + rng.uniform(-spread_deg, spread_deg, n_stations),
+    })
+
+
+class MockGeoServer:
+    """
+    Local HTTP server answering Nominatim /search and Overpass /api/interpreter
+    requests from fixture data. point_common_functions() redirects cf to it.
+    """
+
+    def __init__(self, stations_df, latency_seconds=0.0):
+        elements = [{'type': 'node', 'lat': row.lat, 'lon': row.lon, 'tags': {'name': row.Station_Name}}
+                    for row in stations_df.itertuples()]
+        overpass_body = json.dumps({'elements': elements}).encode()
+        latency = latency_seconds
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if latency:
+                    threading.Event().wait(latency)
+                if url.path.startswith('/search'):
+                    query = parse_qs(url.query).get('q', [''])[0]
+                    body = json.dumps([{'lat': '21.25', 'lon': '81.63', 'display_name': query.title(),
+                                        'place_id': 1, 'boundingbox': ['21', '22', '81', '82']}]).encode()
+                else:
+                    body = overpass_body
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def point_common_functions(self):
+        cf.OVERPASS_URL = f"{self.base_url}/api/interpreter"
+        cf.NOMINATIM_DOMAIN = self.base_url.split('//', 1)[1]
+        cf.NOMINATIM_SCHEME = 'http'
+        cf._nominatim_client = None
+
+    def close(self):
+        self.server.shutdown()
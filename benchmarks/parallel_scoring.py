@@ -0,0 +1,48 @@
+# benchmarks/parallel_scoring.py
+# Measures how cf.ScoringPool scales from 1 to N worker processes.
+#
+# Usage (from the repo root, after the model file is available):
+#   python benchmarks/parallel_scoring.py --rows 500000 --max-workers 8
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common_functions as cf
+from fixtures import synthetic_records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Process-pool scoring scalability benchmark.")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--chunk-size', type=int, default=cf.PARALLEL_CHUNK_SIZE)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--pickle', default=cf.LOCAL_FILE_PATH)
+    parser.add_argument('--package', default=cf.PACKAGED_MODEL_DIR)
+    args = parser.parse_args()
+
+    records = synthetic_records(args.rows)
+    reference = None
+    baseline = None
+
+    print(f"{'workers':>7} {'seconds':>8} {'rows/s':>12} {'speedup':>8}")
+    for n_workers in range(1, args.max_workers + 1):
+        with cf.ScoringPool(n_workers, args.chunk_size, args.pickle, args.package) as pool:
+            pool.predict(records.iloc[:n_workers]) # warm up: start workers and load the model
+            start = time.perf_counter()
+            result = pool.predict(records)
+            elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference, baseline = result, elapsed
+        elif not np.array_equal(result, reference):
+            raise SystemExit(f"Results with {n_workers} workers differ from the 1-worker run")
+        print(f"{n_workers:>7} {elapsed:>8.2f} {args.rows / elapsed:>12,.0f} {baseline / elapsed:>8.2f}x")
+
+
+if __name__ == '__main__':
+    main()
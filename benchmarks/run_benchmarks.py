@@ -0,0 +1,242 @@
+# benchmarks/run_benchmarks.py
+# Offline benchmark suite for the hot paths in common_functions.py. Uses a
+# synthetic fixture model and a local mock HTTP server, so no network or real
+# model file is needed. Results are written as JSON for comparison between
+# commits.
+#
+# Usage:
+#   python benchmarks/run_benchmarks.py                       # writes benchmarks/results/<git sha>.json
+#   python benchmarks/run_benchmarks.py --quick --output now.json
+#   python benchmarks/run_benchmarks.py --compare benchmarks/results/<old sha>.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import common_functions as cf
+from fixtures import MockGeoServer, make_fixture_model, synthetic_records, synthetic_stations
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def measure(fn, repeat=5, number=1):
+    """
+    Runs fn number times per repeat; returns best/median seconds per call and
+    the peak traced memory of one extra call.
+    """
+    fn() # warm up
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'best_s': min(timings), 'median_s': float(np.median(timings)), 'peak_mem_bytes': peak}
+
+
+def bench_prediction(model, n_rows, results):
+    records = synthetic_records(n_rows).to_dict('records')
+    single = records[0]
+
+    results['prepare_input'] = measure(lambda: cf.prepare_input(60, 25, 2, 2, 2, 0.0, 75), repeat=5, number=2000)
+    results['build_feature_matrix_1'] = measure(lambda: cf.build_feature_matrix([single]), number=500)
+    results[f'build_feature_matrix_{n_rows}'] = measure(lambda: cf.build_feature_matrix(records))
+
+    cf.USE_PREDICTION_CACHE = False
+    results['predict_single_row'] = measure(lambda: cf.predict_energy_consumption_local(single, model), number=20)
+
+    # Row-at-a-time loop vs one batch call over the same rows
+    loop_rows = records[:min(200, n_rows)]
+    loop = measure(lambda: [cf.predict_energy_consumption_local(r, model) for r in loop_rows], repeat=3)
+    loop['rows_per_s'] = len(loop_rows) / loop['best_s']
+    results['predict_row_loop'] = loop
+
+    batch = measure(lambda: cf.predict_energy_consumption_batch(records, model), repeat=3)
+    batch['rows_per_s'] = n_rows / batch['best_s']
+    results[f'predict_batch_{n_rows}'] = batch
+
+    default_backend, cf.INFERENCE_BACKEND = cf.INFERENCE_BACKEND, 'flat'
+    results['predict_single_row_flat'] = measure(lambda: cf.predict_energy_consumption_local(single, model), number=20)
+    flat = measure(lambda: cf.predict_energy_consumption_batch(records, model), repeat=3)
+    flat['rows_per_s'] = n_rows / flat['best_s']
+    results[f'predict_batch_{n_rows}_flat'] = flat
+    cf.INFERENCE_BACKEND = default_backend
+
+    cf.USE_PREDICTION_CACHE = True
+    cf.PREDICTION_CACHE.clear()
+    key = cf.prepare_input(60, 25, 2, 2, 2, 0.0, 75)
+    results['predict_cached_hit'] = measure(lambda: cf.predict_energy_consumption_fast(key, model), number=2000)
+
+
+def bench_geodesic(station_counts, results):
+    for n_stations in station_counts:
+        stations = synthetic_stations(n_stations)
+        lats, lons = stations['lat'].to_numpy(), stations['lon'].to_numpy()
+        results[f'haversine_scalar_loop_{n_stations}'] = measure(
+            lambda: [cf.haversine(21.25, 81.63, a, b) for a, b in zip(lats, lons)], repeat=3)
+        results[f'haversine_np_{n_stations}'] = measure(lambda: cf.haversine_np(21.25, 81.63, lats, lons))
+        results[f'nearest_station_details_{n_stations}'] = measure(
+            lambda: cf.calculate_nearest_station_details(stations, 21.25, 81.63))
+
+        index = cf.StationIndex(stations, fetched_at=time.time())
+        results[f'station_index_radius_5km_{n_stations}'] = measure(
+            lambda: index.query_radius(21.25, 81.63, 5), number=50)
+
+
+def bench_network(results, n_stations=2000):
+    """Geocoding and station search against the local mock server."""
+    server = MockGeoServer(synthetic_stations(n_stations), latency_seconds=0.02)
+    server.point_common_functions()
+    cf.USE_LOCAL_STATION_STORE = False
+    try:
+        cf.USE_OVERPASS_TILE_CACHE = False
+        results['overpass_direct_15km'] = measure(
+            lambda: cf.find_nearest_charging_stations(21.25, 81.63, 15), repeat=3)
+
+        cf.USE_OVERPASS_TILE_CACHE = True
+        cf.OVERPASS_TILE_CACHE = cf.OverpassTileCache()
+        results['overpass_tile_cache_warm_5km'] = measure(
+            lambda: cf.find_nearest_charging_stations(21.25, 81.63, 5), number=20)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cf.set_geocode_cache(cf.GeocodingCache(db_path=os.path.join(tmp, 'geo.sqlite3')))
+            counter = iter(range(10**9))
+            results['geocode_miss'] = measure(lambda: cf.get_coordinates_from_query(f"city {next(counter)}"), repeat=3)
+            results['geocode_hit'] = measure(lambda: cf.get_coordinates_from_query("pune"), number=200)
+
+            results['chat_turn_station_search'] = measure(
+                lambda: cf.search_stations_for_location(f"city {next(counter)}"), repeat=3)
+    finally:
+        server.close()
+
+
+def session_bytes(build):
+    """Traced memory still held by the object build() returns."""
+    tracemalloc.start()
+    session = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return session, current
+
+
+def bench_chat_history(turn_counts, results, history_dir):
+    """Memory per session and per-rerun render cost: unbounded message list vs cf.ChatHistory."""
+    reply = cf.CHAT_DOUBT_RESPONSES['doubt_slope']
+
+    for n_turns in turn_counts:
+        prompts = [f"predict range at {60 + i % 60} km/h with {i % 100}% battery" for i in range(n_turns)]
+
+        def build_list():
+            messages = []
+            for prompt in prompts:
+                messages.append({'role': 'user', 'content': prompt})
+                messages.append({'role': 'assistant', 'content': reply})
+            return messages
+
+        def build_history():
+            history = cf.ChatHistory(window=cf.CHAT_HISTORY_WINDOW, history_dir=history_dir)
+            for prompt in prompts:
+                history.append('user', prompt)
+                history.append('assistant', reply)
+            return history
+
+        messages, list_bytes = session_bytes(build_list)
+        unbounded = measure(lambda: [(m['role'], m['content']) for m in messages], number=20)
+        unbounded['session_bytes'] = list_bytes
+        results[f'chat_rerun_unbounded_{n_turns}_turns'] = unbounded
+
+        history, history_bytes = session_bytes(build_history)
+        bounded = measure(lambda: [(m['role'], m['content']) for m in history.messages()], number=20)
+        bounded['session_bytes'] = history_bytes
+        results[f'chat_rerun_bounded_{n_turns}_turns'] = bounded
+
+
+def bench_model_load(model_path, package_dir, results):
+    results['model_cold_load_pickle'] = measure(lambda: cf.load_model_artifact(model_path, '/nonexistent'), repeat=3)
+    cf.package_model(model_path, package_dir)
+    results['model_cold_load_package'] = measure(lambda: cf.load_model_artifact(model_path, package_dir), repeat=3)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True,
+                                       cwd=os.path.dirname(RESULTS_DIR)).strip()
+    except Exception:
+        return 'unknown'
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)['benchmarks']
+    print(f"\n{'benchmark':<42} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for name, result in current.items():
+        if name in baseline:
+            ratio = result['best_s'] / baseline[name]['best_s']
+            flag = '  <-- slower' if ratio > 1.2 else ''
+            print(f"{name:<42} {baseline[name]['best_s']:>12.6f} {result['best_s']:>12.6f} {ratio:>6.2f}x{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for common_functions hot paths.")
+    parser.add_argument('--quick', action='store_true', help="Smaller sizes for a fast smoke run")
+    parser.add_argument('--output', help="Result JSON path (default: benchmarks/results/<git sha>.json)")
+    parser.add_argument('--compare', help="Earlier result JSON to compare against")
+    args = parser.parse_args()
+
+    n_rows = 2_000 if args.quick else 20_000
+    station_counts = [10, 1_000, 10_000] if args.quick else [10, 100, 1_000, 10_000, 100_000]
+    turn_counts = [10, 1_000] if args.quick else [10, 100, 1_000, 10_000]
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = os.path.join(tmp, 'fixture_model.pkl')
+        model = make_fixture_model(model_path, n_estimators=30 if args.quick else 100)
+
+        bench_model_load(model_path, os.path.join(tmp, 'package'), results)
+        bench_prediction(model, n_rows, results)
+        bench_geodesic(station_counts, results)
+        bench_network(results)
+        bench_chat_history(turn_counts, results, os.path.join(tmp, 'chat_history'))
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'quick': args.quick,
+        'benchmarks': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['revision']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, result in results.items():
+        extra = f"  {result['rows_per_s']:,.0f} rows/s" if 'rows_per_s' in result else ''
+        extra += f"  session {result['session_bytes'] / 1024:,.1f} KiB" if 'session_bytes' in result else ''
+        print(f"{name:<42} {result['best_s'] * 1e3:>10.3f} ms  peak {result['peak_mem_bytes'] / 1024:>9.1f} KiB{extra}")
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,81 @@
+import time
+_module_import_started = time.perf_counter()
+
 import streamlit as st
 import pandas as pd
-from geopy.geocoders import Nominatim
-# Importer Group: Geopy is a critical external library here
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
-
 import numpy as np
+import importlib
+import bisect
+import hashlib
+import heapq
+import itertools
+import threading
+import weakref
+import uuid
+import sqlite3
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+import contextvars
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import pickle 
-import gdown 
+import json
+import logging
 import os 
 import re 
 from math import radians, sin, cos, sqrt, atan2
-import requests 
+
+logger = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# LAZY IMPORTS & STARTUP PROFILE
+# ==============================================================================
+
+# Stage -> seconds, e.g. 'import scipy.spatial' or 'model load'
+STARTUP_PROFILE = {}
+
+
+def record_startup(stage, seconds):
+    STARTUP_PROFILE[stage] = seconds
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access, so
+    dependencies only some features need (geocoding, station index, model
+    download) stay off the page's cold-start path. The import time is
+    recorded in STARTUP_PROFILE.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        start = time.perf_counter()
+        module = importlib.import_module(self._name)
+        if self._module is None:
+            record_startup(f"import {self._name}", time.perf_counter() - start)
+        self._module = module
+        return module
+
+    def __getattr__(self, attr):
+        module = self._module
+        if module is None:
+            module = self._load()
+        return getattr(module, attr)
+
+    def __repr__(self):
+        return f"<LazyModule {self._name!r} ({'loaded' if self._module is not None else 'not loaded'})>"
+
+
+gdown = LazyModule('gdown')
+joblib = LazyModule('joblib')
+requests = LazyModule('requests') # requests.adapters is imported by requests itself
+geopy_geocoders = LazyModule('geopy.geocoders')
+geopy_exc = LazyModule('geopy.exc')
+scipy_spatial = LazyModule('scipy.spatial')
 
 # ==============================================================================
 # CONFIGURATION: CONSTANTS & MODEL SETUP
@@ -23,6 +88,11 @@ EARTH_RADIUS_KM = 6371
 DRIVE_FILE_ID = '11DRnNwkkYM9OxZELxU93B0pvFjLQYiwc' 
 LOCAL_FILE_PATH = 'ev_energy_consumption_model.pkl'
 
+# Memory-mappable model package built by package_model.py
+PACKAGED_MODEL_DIR = 'ev_model_package'
+PACKAGED_MODEL_FILENAME = 'model.joblib'
+MODEL_MANIFEST_FILENAME = 'manifest.json'
+
 # Green Skills and Vehicle Constants
 TOTAL_USABLE_BATTERY_KWH = 60.0 
 EMISSION_FACTOR_KG_PER_KM = 0.18 
@@ -38,26 +108,498 @@ FEATURE_NAMES = [
     'Traffic_Condition_2', 'Traffic_Condition_3', 
     'Weather_Condition_2', 'Weather_Condition_3', 'Weather_Condition_4' 
 ]
+FEATURE_INDEX = {name: idx for idx, name in enumerate(FEATURE_NAMES)}
+
+# One-hot encoded inputs: raw key -> {level: column index in FEATURE_NAMES}
+CATEGORICAL_FEATURES = ['Driving_Mode', 'Road_Type', 'Traffic_Condition', 'Weather_Condition']
+CATEGORICAL_DUMMY_INDEX = {
+    key: {int(name.rsplit('_', 1)[1]): idx for name, idx in FEATURE_INDEX.items() if name.startswith(f"{key}_")}
+    for key in CATEGORICAL_FEATURES
+}
+
+# Consumption clamp (kWh/km) applied after scaling, and fallback when prediction fails
+MIN_CONSUMPTION_KWH_PER_KM = 0.12
+MAX_CONSUMPTION_KWH_PER_KM = 0.35
+DEFAULT_CONSUMPTION_KWH_PER_KM = 0.15
+
+# ==============================================================================
+# INSTRUMENTATION: LATENCY HISTOGRAMS, COUNTERS, METRICS EXPORT
+# ==============================================================================
+
+# Histogram bucket upper bounds in seconds (Prometheus 'le' labels)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICS_PREFIX = 'ev_app_'
+
+
+class LatencyHistogram:
+    """Cumulative-bucket latency histogram; observe() is a bisect and three adds."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = list(itertools.accumulate(self.counts))
+        return {
+            'count': self.count,
+            'sum': self.total,
+            'buckets': {str(bound): n for bound, n in zip(list(self.buckets) + ['+Inf'], cumulative)},
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide timings and counters. Cache hit ratios are read from the
+    live cache objects at export time, so the hot path never touches them.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @contextmanager
+    def timed(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def cache_stats(self):
+        caches = {'prediction_cache': PREDICTION_CACHE, 'overpass_tile_cache': OVERPASS_TILE_CACHE}
+        if _geocode_cache is not None:
+            caches['geocode_cache'] = _geocode_cache
+        return {name: cache.stats() for name, cache in caches.items()}
+
+    def snapshot(self):
+        """JSON-serializable view of every metric."""
+        with self._lock:
+            histograms = {name: h.snapshot() for name, h in self._histograms.items()}
+            counters = dict(self._counters)
+        return {'histograms': histograms, 'counters': counters, 'caches': self.cache_stats(),
+                'startup': startup_profile()}
+
+    def to_prometheus(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, histogram in sorted(snapshot['histograms'].items()):
+            metric = METRICS_PREFIX + name
+            lines.append(f"# TYPE {metric} histogram")
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = METRICS_PREFIX + name
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+        for cache, stats in sorted(snapshot['caches'].items()):
+            for stat, value in sorted(stats.items()):
+                metric = f"{METRICS_PREFIX}{cache}_{stat}"
+                lines.append(f"# TYPE {metric} gauge")
+                lines.append(f"{metric} {value}")
+        if snapshot['startup']:
+            metric = METRICS_PREFIX + 'startup_seconds'
+            lines.append(f"# TYPE {metric} gauge")
+            for stage, seconds in snapshot['startup'].items():
+                lines.append(f'{metric}{{stage="{stage}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+_metrics_server = None
+
+
+def start_metrics_server(port, host='0.0.0.0'):
+    """
+    Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+    Safe to call more than once; only the first call starts a server.
+    """
+    global _metrics_server
+    if _metrics_server is not None:
+        return _metrics_server
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = METRICS.to_prometheus().encode(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(METRICS.snapshot()).encode(), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    _metrics_server = ThreadingHTTPServer((host, int(port)), MetricsHandler)
+    threading.Thread(target=_metrics_server.serve_forever, name='ev-metrics', daemon=True).start()
+    return _metrics_server
+
 
 # --- DOWNLOAD & LOAD MODEL FUNCTION ---
-@st.cache_resource
-def download_file_from_drive():
-    """Tries to download and load the ML model."""
-    if not os.path.exists(LOCAL_FILE_PATH):
+def file_sha256(path, chunk_size=1 << 20):
+    """Returns the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def package_model(pickle_path=LOCAL_FILE_PATH, package_dir=PACKAGED_MODEL_DIR):
+    """
+    Converts the pickled model into an uncompressed joblib artifact and flat
+    forest node arrays (.npy) that can be memory-mapped, plus a manifest of
+    SHA-256 checksums.
+    Returns the manifest dict.
+    """
+    with open(pickle_path, 'rb') as f:
+        model = pickle.load(f)
+
+    os.makedirs(package_dir, exist_ok=True)
+    joblib.dump(model, os.path.join(package_dir, PACKAGED_MODEL_FILENAME))
+    # Flat node arrays are what worker processes actually share via mmap
+    flat_forest = FlatForest.from_model(model)
+    flat_forest.save(package_dir)
+
+    manifest = {
+        'source_sha256': file_sha256(pickle_path),
+        # Only an exact export is served in place of the estimator (see load_model_package)
+        'flat_forest_max_abs_difference': flat_forest.max_abs_difference(model),
+        'files': {
+            name: file_sha256(os.path.join(package_dir, name))
+            for name in sorted(os.listdir(package_dir)) if name != MODEL_MANIFEST_FILENAME
+        },
+    }
+    with open(os.path.join(package_dir, MODEL_MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+# Loaded model -> {'sha256': ...} or {'path': ...} of the pickle it came from;
+# keys per-model artifacts on disk such as the consumption grid
+_model_sources = weakref.WeakKeyDictionary()
+
+
+def record_model_source(loaded_model, sha256=None, path=None):
+    try:
+        _model_sources[loaded_model] = {'sha256': sha256} if sha256 else {'path': path}
+    except TypeError:
+        pass # not weak-referenceable
+
+
+def model_source_hash(loaded_model, fallback_path=LOCAL_FILE_PATH):
+    """
+    SHA-256 of the pickle a loaded model was built from (package/registry
+    manifests record it; plain pickles are hashed on first use). Models of
+    unknown origin fall back to hashing fallback_path.
+    """
+    try:
+        source = _model_sources.get(loaded_model)
+    except TypeError:
+        source = None
+    if source is None:
+        return file_sha256(fallback_path)
+    if source.get('sha256') is None:
+        source['sha256'] = file_sha256(source['path'])
+    return source['sha256']
+
+
+def verify_package_files(package_dir, manifest, names=None):
+    """Checks package files (all by default) against the manifest checksums; raises ValueError on mismatch."""
+    for name, expected in manifest['files'].items():
+        if names is not None and name not in names:
+            continue
+        actual = file_sha256(os.path.join(package_dir, name))
+        if actual != expected:
+            raise ValueError(f"Checksum mismatch for {name}: expected {expected[:12]}, got {actual[:12]}")
+
+
+def load_packaged_model(package_dir=PACKAGED_MODEL_DIR, mmap_mode='r', verify=True):
+    """
+    Loads a package_model artifact with joblib memory-mapping, after checking
+    every file against the manifest checksums (raises ValueError on mismatch).
+    """
+    with open(os.path.join(package_dir, MODEL_MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+
+    if verify:
+        verify_package_files(package_dir, manifest)
+
+    model = joblib.load(os.path.join(package_dir, PACKAGED_MODEL_FILENAME), mmap_mode=mmap_mode)
+    record_model_source(model, sha256=manifest['source_sha256'])
+    return model
+
+
+def load_model_package(package_dir=PACKAGED_MODEL_DIR):
+    """
+    Loads a package for serving. When its flat forest export was verified
+    exact, returns the memory-mapped FlatForest itself, so the tree arrays stay
+    read-only file pages shared by every process (unpickling the estimator
+    copies them into private memory). Otherwise returns the estimator.
+    """
+    with open(os.path.join(package_dir, MODEL_MANIFEST_FILENAME)) as f:
+        manifest = json.load(f)
+
+    if INFERENCE_BACKEND != 'sklearn' and manifest.get('flat_forest_max_abs_difference') == 0.0:
+        verify_package_files(package_dir, manifest, [name for name in manifest['files'] if name.startswith('forest_')])
+        model = FlatForest.load(package_dir)
+        record_model_source(model, sha256=manifest['source_sha256'])
+        return model
+
+    model = load_packaged_model(package_dir)
+    if os.path.exists(os.path.join(package_dir, 'forest_roots.npy')):
+        get_flat_forest(model, package_dir=package_dir)
+    return model
+
+
+def load_model_artifact(pickle_path=LOCAL_FILE_PATH, package_dir=PACKAGED_MODEL_DIR):
+    """
+    Loads the packaged (memory-mapped) model when available, otherwise the
+    pickle. Logs which artifact was used and how long it took. No Streamlit
+    calls, so batch workers can use it directly.
+    """
+    start = time.perf_counter()
+    if os.path.exists(os.path.join(package_dir, MODEL_MANIFEST_FILENAME)):
+        model = load_model_package(package_dir)
+        source = package_dir
+    else:
+        with open(pickle_path, 'rb') as f:
+            model = pickle.load(f)
+        record_model_source(model, path=pickle_path)
+        source = pickle_path
+    elapsed = time.perf_counter() - start
+    METRICS.observe('model_load_seconds', elapsed)
+    logger.info("Loaded model from %s in %.3f s", source, elapsed)
+    return model
+
+
+_model_future = None
+_model_future_lock = threading.Lock()
+
+
+def _download_and_load_model():
+    version = MODEL_REGISTRY.active_version()
+    if version is not None:
+        start = time.perf_counter()
+        model = MODEL_REGISTRY.load(version)
+        LIVE_MODEL.install(version, model)
+        record_startup('model load', time.perf_counter() - start)
+        return model
+
+    has_package = os.path.exists(os.path.join(PACKAGED_MODEL_DIR, MODEL_MANIFEST_FILENAME))
+    if not has_package and not os.path.exists(LOCAL_FILE_PATH):
+        start = time.perf_counter()
         try:
             gdown.download(id=DRIVE_FILE_ID, output=LOCAL_FILE_PATH, quiet=False)
         except Exception as e:
-            st.error(f"Model Download Error: {e}")
+            logger.error("Model download failed: %s", e)
+        record_startup('model download', time.perf_counter() - start)
+
+    start = time.perf_counter()
+    model = load_model_artifact()
+    record_startup('model load', time.perf_counter() - start)
+    return model
+
+
+def start_model_warmup():
+    """
+    Starts downloading/loading the model in a background thread, once per
+    process, and returns a Future for it. Pages call this first so the model
+    loads while the rest of the page renders.
+    """
+    global _model_future
+    with _model_future_lock:
+        if _model_future is None:
+            future = _model_future = Future()
+
+            def warm_up():
+                try:
+                    future.set_result(_download_and_load_model())
+                except Exception as e:
+                    future.set_exception(e)
+
+            threading.Thread(target=warm_up, name='ev-model-warmup', daemon=True).start()
+        return _model_future
+
 
+def download_file_from_drive():
+    """Tries to download and load the ML model (waits for the background warm-up)."""
     try:
-        with open(LOCAL_FILE_PATH, 'rb') as f:
-            model = pickle.load(f)
+        # Switches to a newly activated registry version once it has been warmed up
+        model = LIVE_MODEL.current(default=start_model_warmup().result())
         st.sidebar.success("Model Loaded Successfully!")
         return model
     except Exception as e:
         st.sidebar.error(f"Model Load Error: Check file/corruption. {e}")
         return None
 
+
+def startup_profile():
+    """Import and load times recorded so far, slowest first."""
+    return dict(sorted(STARTUP_PROFILE.items(), key=lambda item: item[1], reverse=True))
+
+# --- FLAT-ARRAY FOREST INFERENCE (OPTIONAL BACKEND) ---
+# 'sklearn' calls loaded_model.predict; 'flat' evaluates exported node arrays with NumPy;
+# 'auto' serves packaged models from their memory-mapped arrays and anything else with sklearn
+INFERENCE_BACKEND = 'auto'
+FLAT_FOREST_CHUNK_SIZE = 8192
+
+
+class FlatForest:
+    """
+    A fitted RandomForestRegressor (or single regression tree) exported to
+    contiguous node arrays. Trees are concatenated; leaves point to themselves
+    with an infinite threshold, so traversal is a fixed number of vectorized
+    steps across all trees and samples at once.
+    """
+
+    ARRAY_NAMES = ('feature', 'threshold', 'children_left', 'children_right', 'value', 'roots')
+
+    def __init__(self, feature, threshold, children_left, children_right, value, roots, max_depth):
+        self.feature = feature
+        self.threshold = threshold
+        self.children_left = children_left
+        self.children_right = children_right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+    @classmethod
+    def from_model(cls, loaded_model):
+        estimators = getattr(loaded_model, 'estimators_', None) or [loaded_model]
+        trees = [estimator.tree_ for estimator in estimators]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise ValueError("FlatForest only supports single-output regression models.")
+
+        parts = {name: [] for name in cls.ARRAY_NAMES}
+        offset = 0
+        for tree in trees:
+            node_ids = np.arange(tree.node_count, dtype=np.int64) + offset
+            is_leaf = tree.children_left == -1
+
+            parts['feature'].append(np.where(is_leaf, 0, tree.feature).astype(np.int64))
+            parts['threshold'].append(np.where(is_leaf, np.inf, tree.threshold))
+            parts['children_left'].append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            parts['children_right'].append(np.where(is_leaf, node_ids, tree.children_right + offset))
+            parts['value'].append(tree.value[:, 0, 0].astype(np.float64))
+            parts['roots'].append(np.array([offset], dtype=np.int64))
+            offset += tree.node_count
+
+        arrays = {name: np.ascontiguousarray(np.concatenate(chunks)) for name, chunks in parts.items()}
+        return cls(max_depth=max(tree.max_depth for tree in trees), **arrays)
+
+    @classmethod
+    def load(cls, package_dir, mmap_mode='r'):
+        arrays = {name: np.load(os.path.join(package_dir, f"forest_{name}.npy"), mmap_mode=mmap_mode)
+                  for name in cls.ARRAY_NAMES}
+        max_depth = np.load(os.path.join(package_dir, 'forest_max_depth.npy'))
+        return cls(max_depth=int(max_depth), **arrays)
+
+    def save(self, package_dir):
+        for name in self.ARRAY_NAMES:
+            np.save(os.path.join(package_dir, f"forest_{name}.npy"), getattr(self, name))
+        np.save(os.path.join(package_dir, 'forest_max_depth.npy'), np.int64(self.max_depth))
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    def predict(self, feature_matrix, chunk_size=FLAT_FOREST_CHUNK_SIZE):
+        """Mean of per-tree leaf values; matches RandomForestRegressor.predict."""
+        return self.predict_per_tree(feature_matrix, chunk_size).sum(axis=0) / self.n_trees
+
+    def predict_per_tree(self, feature_matrix, chunk_size=FLAT_FOREST_CHUNK_SIZE):
+        """Leaf value of every tree for every row, shape (n_trees, n_rows)."""
+        # scikit-learn compares float32 inputs against float64 thresholds
+        X = np.asarray(feature_matrix, dtype=np.float32)
+        out = np.empty((self.n_trees, X.shape[0]), dtype=np.float64)
+
+        for start in range(0, X.shape[0], chunk_size):
+            X_chunk = X[start:start + chunk_size]
+            rows = np.arange(X_chunk.shape[0])[np.newaxis, :]
+            nodes = np.repeat(self.roots[:, np.newaxis], X_chunk.shape[0], axis=1)
+
+            # One level per step for all trees x rows; leaves loop back to themselves
+            for _ in range(self.max_depth):
+                go_left = X_chunk[rows, self.feature[nodes]] <= self.threshold[nodes]
+                nodes = np.where(go_left, self.children_left[nodes], self.children_right[nodes])
+
+            out[:, start:start + chunk_size] = self.value[nodes]
+        return out
+
+    def max_abs_difference(self, loaded_model, n_samples=1000, seed=0):
+        """Equivalence check against loaded_model.predict on random in-range feature rows."""
+        rng = np.random.default_rng(seed)
+        X = rng.uniform(-10, 400, size=(n_samples, len(FEATURE_NAMES)))
+        X[:, FEATURE_INDEX['Vehicle_Weight_kg']] = rng.uniform(1000, 3000, n_samples)
+        for dummy_columns in CATEGORICAL_DUMMY_INDEX.values():
+            X[:, list(dummy_columns.values())] = rng.integers(0, 2, size=(n_samples, len(dummy_columns)))
+        return float(np.max(np.abs(self.predict(X) - predict_raw_consumption(X, loaded_model, backend='sklearn'))))
+
+
+_flat_forests = weakref.WeakKeyDictionary()
+_flat_forest_lock = threading.Lock()
+
+
+def get_flat_forest(loaded_model, package_dir=None):
+    """
+    Returns the FlatForest for a loaded model, exporting it on first use (or
+    memory-mapping it from package_dir when given).
+    """
+    if isinstance(loaded_model, FlatForest):
+        return loaded_model
+    with _flat_forest_lock:
+        flat_forest = _flat_forests.get(loaded_model)
+        if flat_forest is None:
+            if package_dir is not None:
+                flat_forest = FlatForest.load(package_dir)
+            else:
+                flat_forest = FlatForest.from_model(loaded_model)
+            _flat_forests[loaded_model] = flat_forest
+        return flat_forest
+
+
+def predict_raw_consumption(feature_matrix, loaded_model, backend=None):
+    """Unscaled model output for a FEATURE_NAMES-ordered matrix using the selected backend."""
+    backend = backend or INFERENCE_BACKEND
+    if backend == 'flat' or isinstance(loaded_model, FlatForest):
+        return get_flat_forest(loaded_model).predict(feature_matrix)
+
+    # Models fitted on a DataFrame warn when given bare arrays, so keep the column names
+    if hasattr(loaded_model, 'feature_names_in_'):
+        model_input = pd.DataFrame(feature_matrix, columns=FEATURE_NAMES, copy=False)
+    else:
+        model_input = feature_matrix
+    return loaded_model.predict(model_input)
+
+
 # INPUT MAPPING
 def prepare_input(speed, temp, mode, road, traffic, slope, battery_state):
     input_data = {
@@ -80,44 +622,227 @@ def prepare_input(speed, temp, mode, road, traffic, slope, battery_state):
     }
     return input_data
 
+
+# prepare_input argument -> record key
+PREPARE_INPUT_ARGUMENTS = {
+    'speed': 'Speed_kmh', 'temp': 'Temperature_C', 'mode': 'Driving_Mode', 'road': 'Road_Type',
+    'traffic': 'Traffic_Condition', 'slope': 'Slope_%', 'battery_state': 'Battery_State_%',
+}
+
+
+def prepare_input_frame(frame, column_map=None, defaults=None):
+    """
+    Vectorized prepare_input over a DataFrame of trips/segments. Each record
+    key is taken from column_map[key], a column with the key's own name, or
+    a column named like the prepare_input argument (speed, temp, ...).
+    Keys with no column get defaults[key] (a scalar or per-row array, e.g.
+    from VehicleProfileRegistry.input_defaults) or the prepare_input
+    defaults; the seven prepare_input arguments are required. Values that
+    are not numeric become NaN (see invalid_input_rows).
+    """
+    column_map = column_map or {}
+    defaults = defaults or {}
+    argument_names = {key: arg for arg, key in PREPARE_INPUT_ARGUMENTS.items()}
+    records = {}
+    missing = []
+
+    for key, default in prepare_input(*[None] * len(PREPARE_INPUT_ARGUMENTS)).items():
+        for source in (column_map.get(key), key, argument_names.get(key)):
+            if source is not None and source in frame.columns:
+                records[key] = pd.to_numeric(frame[source], errors='coerce').to_numpy(dtype=np.float64)
+                break
+        else:
+            if key in defaults:
+                records[key] = np.broadcast_to(defaults[key], len(frame)).copy()
+            elif default is None:
+                missing.append(key)
+            else:
+                records[key] = np.full(len(frame), default)
+
+    if missing:
+        raise ValueError(f"Input is missing required columns for: {', '.join(missing)}")
+    return pd.DataFrame(records, index=frame.index)
+
+
+def model_input_columns(input_records):
+    """
+    Model input columns of prepare_input-style records (a DataFrame or dicts)
+    as float64 arrays; missing and non-numeric values become NaN.
+    Returns (columns, n_rows).
+    """
+    if isinstance(input_records, pd.DataFrame):
+        raw = {key: input_records[key] for key in input_records.columns}
+        n_rows = len(input_records)
+    else:
+        records = list(input_records)
+        n_rows = len(records)
+        keys = set()
+        for record in records:
+            keys.update(record.keys())
+        raw = {key: [record.get(key, np.nan) for record in records] for key in keys}
+
+    columns = {}
+    for key, values in raw.items():
+        if key in FEATURE_INDEX or key in CATEGORICAL_FEATURES:
+            try:
+                columns[key] = np.asarray(values, dtype=np.float64)
+            except (TypeError, ValueError):
+                columns[key] = pd.to_numeric(pd.Series(values, dtype=object), errors='coerce').to_numpy(dtype=np.float64)
+    return columns, n_rows
+
+
+def invalid_input_rows(input_records):
+    """Boolean mask of prepare_input-style rows with a missing or non-numeric model input."""
+    columns, n_rows = model_input_columns(input_records)
+    invalid = np.zeros(n_rows, dtype=bool)
+    for values in columns.values():
+        invalid |= np.isnan(values)
+    return invalid
+
+
+def build_feature_matrix(input_records):
+    """
+    One-hot encodes prepare_input-style records into a single preallocated
+    NumPy matrix with columns in FEATURE_NAMES order. Rows with a missing or
+    non-numeric input (invalid_input_rows) keep NaN in that feature's
+    column(s) instead of being zero-filled.
+    """
+    columns, n_rows = model_input_columns(input_records)
+    feature_matrix = np.zeros((n_rows, len(FEATURE_NAMES)), dtype=np.float64)
+
+    for key, values in columns.items():
+        if key in FEATURE_INDEX:
+            feature_matrix[:, FEATURE_INDEX[key]] = values
+        else:
+            # Only levels that exist as dummy columns are set (baseline level stays all-zero)
+            missing = np.isnan(values)
+            for level, col_idx in CATEGORICAL_DUMMY_INDEX[key].items():
+                feature_matrix[:, col_idx] = np.where(missing, np.nan, values == level)
+
+    return feature_matrix
+
+
+def scale_consumption(raw_prediction, profile=None):
+    """
+    Applies the scaling factor and the 0.12-0.35 kWh/km clamp to a vector of
+    raw model outputs. With profile (per-row arrays from
+    VehicleProfileRegistry.lookup) each row uses its vehicle's factor and bounds.
+    """
+    if profile is not None:
+        return np.clip(np.asarray(raw_prediction, dtype=np.float64) / profile['scaling_factor'],
+                       profile['min_consumption_kwh_per_km'], profile['max_consumption_kwh_per_km'])
+
+    # Min consumption floor: Ensures max range is 500 km (60 kWh / 0.12)
+    # Upper bound (for high-speed/sport mode)
+    return np.clip(np.asarray(raw_prediction, dtype=np.float64) / MODEL_SCALING_FACTOR,
+                   MIN_CONSUMPTION_KWH_PER_KM, MAX_CONSUMPTION_KWH_PER_KM)
+
+
+def predict_energy_consumption_batch(input_records, loaded_model, profile=None):
+    """
+    Batch version of predict_energy_consumption_local: encodes all records into
+    one feature matrix and makes a single model.predict call.
+    Returns a NumPy array of scaled consumption values (kWh/km), scaled per
+    row when a vehicle profile lookup is given. Rows with a missing or
+    non-numeric input (invalid_input_rows) are not scored and come back NaN.
+    """
+    if not isinstance(input_records, pd.DataFrame):
+        input_records = list(input_records)
+    n_rows = len(input_records)
+
+    if loaded_model is None:
+        METRICS.increment('prediction_no_model_default_total', n_rows)
+        return np.full(n_rows, DEFAULT_CONSUMPTION_KWH_PER_KM) # Default consumption (conservative)
+
+    if n_rows == 0:
+        return np.empty(0, dtype=np.float64)
+
+    try:
+        return _predict_scaled_consumption(input_records, loaded_model, profile)
+    except Exception as e:
+        # Prediction logic fail hone par safe, typical value de
+        return prediction_fallback(n_rows, e)
+
+
+def _predict_scaled_consumption(input_records, loaded_model, profile=None):
+    """predict_energy_consumption_batch without the fallback: model errors propagate."""
+    with METRICS.timed('feature_build_seconds'):
+        feature_matrix = build_feature_matrix(input_records)
+    invalid = np.isnan(feature_matrix).any(axis=1) # same rows as invalid_input_rows
+    if not invalid.any():
+        with METRICS.timed('model_predict_seconds'):
+            prediction = predict_raw_consumption(feature_matrix, loaded_model)
+        METRICS.increment('predicted_rows_total', len(feature_matrix))
+        return scale_consumption(prediction, profile)
+
+    METRICS.increment('prediction_invalid_rows_total', int(invalid.sum()))
+    logger.warning("Not scoring %d of %d rows with a missing or non-numeric input", invalid.sum(), len(invalid))
+    valid = ~invalid
+    prediction = np.full(len(feature_matrix), np.nan)
+    if valid.any():
+        with METRICS.timed('model_predict_seconds'):
+            prediction[valid] = predict_raw_consumption(feature_matrix[valid], loaded_model)
+        METRICS.increment('predicted_rows_total', int(valid.sum()))
+    return scale_consumption(prediction, profile)
+
+
+def prediction_fallback(n_rows, error, what="Prediction"):
+    """The conservative default for n_rows failed predictions (counted and logged)."""
+    METRICS.increment('prediction_fallback_total', n_rows)
+    logger.warning("%s failed, using %.2f kWh/km fallback: %s", what, DEFAULT_CONSUMPTION_KWH_PER_KM, error)
+    return np.full(n_rows, DEFAULT_CONSUMPTION_KWH_PER_KM)
+
+
 def predict_energy_consumption_local(input_data_dict, loaded_model):
     """
     Handles data preparation, local prediction, and applies a scaling factor 
     to correct unrealistic ML model output while ensuring dynamic range.
+    Thin single-row wrapper over predict_energy_consumption_batch; an invalid
+    input gets the conservative fallback.
     """
-    global MODEL_SCALING_FACTOR 
+    consumption = float(predict_energy_consumption_batch([input_data_dict], loaded_model)[0])
+    if np.isnan(consumption):
+        return float(prediction_fallback(1, "missing or non-numeric input")[0])
+    return consumption
 
-    if loaded_model is None:
-        return 0.15 # Default consumption (conservative)
 
-    try: 
-        input_data = pd.DataFrame(0, index=[0], columns=FEATURE_NAMES)
+PREDICTION_INTERVAL = (0.05, 0.95) # Quantiles of the per-tree predictions used as interval bounds
 
-        # Fill values and apply One-Hot Encoding
-        for key, value in input_data_dict.items():
-            if key in input_data.columns:
-                input_data.loc[0, key] = value
-            elif key in ['Driving_Mode', 'Road_Type', 'Traffic_Condition', 'Weather_Condition']:
-                dummy_col = f"{key}_{value}"
-                if dummy_col in input_data.columns:
-                    input_data.loc[0, dummy_col] = 1
 
-        input_df = input_data[FEATURE_NAMES]
-        prediction = loaded_model.predict(input_df)
-        consumption = float(prediction[0])
+def predict_energy_consumption_interval(input_records, loaded_model, quantiles=PREDICTION_INTERVAL, profile=None):
+    """
+    Prediction interval from the spread of the forest's individual trees.
+    All trees are evaluated for all rows in one FlatForest pass (no per-tree
+    predict loop). Returns (lower, expected, upper) arrays of scaled
+    consumption; expected is the forest mean, the bounds are the per-tree
+    quantiles. All three are the fallback value if prediction fails, and NaN
+    for rows with a missing or non-numeric input.
+    """
+    if not isinstance(input_records, pd.DataFrame):
+        input_records = list(input_records)
+    n_rows = len(input_records)
 
-        # Min consumption floor: Ensures max range is 500 km (60 kWh / 0.12)
-        consumption_scaled = max(consumption / MODEL_SCALING_FACTOR, 0.12)
+    if loaded_model is None or n_rows == 0:
+        fallback = predict_energy_consumption_batch(input_records, loaded_model, profile)
+        return fallback, fallback, fallback
 
-        # Upper bound (for high-speed/sport mode)
-        if consumption_scaled > 0.35:
-             consumption_scaled = 0.35 
+    try:
+        with METRICS.timed('feature_build_seconds'):
+            feature_matrix = build_feature_matrix(input_records)
+        invalid = np.isnan(feature_matrix).any(axis=1) # same rows as invalid_input_rows
+        with METRICS.timed('model_predict_seconds'):
+            per_tree = get_flat_forest(loaded_model).predict_per_tree(np.where(invalid[:, np.newaxis], 0.0, feature_matrix))
+        per_tree[:, invalid] = np.nan # not scored, as in predict_energy_consumption_batch
+        METRICS.increment('predicted_rows_total', int((~invalid).sum()))
 
-        return consumption_scaled
+        lower, upper = np.quantile(per_tree, quantiles, axis=0)
+        expected = per_tree.sum(axis=0) / len(per_tree) # same as FlatForest.predict
+        # Scaling and clamping are monotonic, so the bounds stay ordered
+        return scale_consumption(lower, profile), scale_consumption(expected, profile), scale_consumption(upper, profile)
 
     except Exception as e:
-        # Prediction logic fail hone par safe, typical value de
-        return 0.15 
+        fallback = prediction_fallback(n_rows, e, "Interval prediction")
+        return fallback, fallback, fallback
 
 
 # GREEN SKILLS LOGIC
@@ -138,115 +863,1405 @@ def calculate_range_metrics(consumption, current_soc):
     return predicted_range, co2_saved_kg
 
 
-# ====================================================================
-# CHARGING STATION LOGIC (USING OPENSTREETMAP - OVERPASS API) 
-# ====================================================================
-
-def haversine(lat1, lon1, lat2, lon2):
-    """Calculates the distance between two points on the earth in kilometers."""
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+def calculate_range_metrics_batch(consumption, current_soc, profile=None):
+    """
+    Vectorized calculate_range_metrics: returns (predicted_range, co2_saved_kg)
+    arrays. With profile, battery capacity and emission factor are per row.
+    """
+    consumption = np.asarray(consumption, dtype=np.float64)
+    current_soc = np.asarray(current_soc, dtype=np.float64)
+    battery_kwh = TOTAL_USABLE_BATTERY_KWH if profile is None else profile['battery_kwh']
+    emission_factor = EMISSION_FACTOR_KG_PER_KM if profile is None else profile['emission_factor_kg_per_km']
 
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
+    remaining_energy = battery_kwh * (current_soc / 100)
+    valid = consumption > 0.0001
+    predicted_range = np.where(valid, remaining_energy / np.where(valid, consumption, 1.0), 0.0)
 
-    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    # Emission Offset (Green Skill 1)
+    co2_saved_kg = predicted_range * emission_factor
 
-    return EARTH_RADIUS_KM * c
+    return predicted_range, co2_saved_kg
 
 
-def get_coordinates_from_query(query):
+def center_interval(consumption_bounds, point_estimate):
     """
-    Converts a location query into (lat, lon) using Nominatim with retry mechanism.
-    FIX: Added robust timeout and service error handling for Nominatim.
+    Moves (lower, expected, upper) consumption so expected is point_estimate
+    (e.g. the cached/grid value a page shows as its headline), keeping the
+    tree spread on either side. The bounds are clamped like scale_consumption
+    but never exclude the point estimate.
     """
-    geolocator = Nominatim(user_agent="EV_App_Assistant_V2")
-    max_attempts = 3
-    
-    for attempt in range(max_attempts):
-        try:
-            # Increased timeout for reliability
-            location = geolocator.geocode(query, timeout=10) 
-            if location:
-                return location.latitude, location.longitude, location.address
-            # If location is None, break and return failure after first attempt
-            break 
-        except (GeocoderTimedOut, GeocoderServiceError, requests.exceptions.RequestException):
-            if attempt < max_attempts - 1:
-                time.sleep(1) # Wait before retry
-                continue
-            break
-        except Exception:
-            break
-            
-    return None, None, None
-
-def generate_gmaps_url(query, is_search=False):
-    """Generates a Google Maps URL for the given query (address or search)."""
-    base_url = "https://www.google.com/maps/"
-    if is_search:
-        # For searching 'Charging Stations near Mumbai'
-        return f"https://www.google.com/maps/search/{query.replace(' ', '+')}"
-    else:
-        # For an address/location
-        return f"https://www.google.com/maps/place/{query.replace(' ', '+')}"
+    lower, expected, upper = (np.asarray(bound, dtype=np.float64) for bound in consumption_bounds)
+    point = np.broadcast_to(np.asarray(point_estimate, dtype=np.float64), expected.shape)
+    shift = point - expected
+    lower = np.minimum(np.clip(lower + shift, MIN_CONSUMPTION_KWH_PER_KM, MAX_CONSUMPTION_KWH_PER_KM), point)
+    upper = np.maximum(np.clip(upper + shift, MIN_CONSUMPTION_KWH_PER_KM, MAX_CONSUMPTION_KWH_PER_KM), point)
+    return lower, point.copy(), upper
 
 
-def find_nearest_charging_stations(user_lat, user_lon, radius_km=5):
+def calculate_range_interval(consumption_bounds, current_soc):
     """
-    Finds charging stations using the free Overpass API (OpenStreetMap data).
-    FIX: Changed Overpass URL to the more robust 'https' version.
+    (min, expected, max) range in km plus the expected CO2 saving, from
+    (lower, expected, upper) consumption via calculate_range_metrics. The
+    highest consumption gives the shortest range.
     """
-    # Overpass Query: find EV charging nodes within radius
-    overpass_url = "https://overpass-api.de/api/interpreter" # Changed to HTTPS
-    radius_meters = radius_km * 1000
+    lower, expected, upper = (float(c) for c in consumption_bounds)
+    range_min, _ = calculate_range_metrics(upper, current_soc)
+    range_expected, co2_saved_kg = calculate_range_metrics(expected, current_soc)
+    range_max, _ = calculate_range_metrics(lower, current_soc)
+    return range_min, range_expected, range_max, co2_saved_kg
 
-    # Overpass QL query: Find nodes with amenity=charging_station around the user location
-    overpass_query = f"""
-    [out:json];
-    node(around:{radius_meters},{user_lat},{user_lon})[amenity=charging_station];
-    out center;
-    """
 
-    try:
-        # Increased timeout for large responses/slow connections
-        response = requests.get(overpass_url, params={'data': overpass_query}, timeout=30) 
-        response.raise_for_status() 
-        data = response.json()
-
-        stations = []
-        for element in data.get('elements', []):
-            if element.get('type') == 'node':
-                stations.append({
-                    'Station_Name': element.get('tags', {}).get('name', 'OSM Station'),
-                    'lat': element['lat'],
-                    'lon': element['lon']
-                })
-
-        if not stations:
-            return pd.DataFrame()
+# ====================================================================
+# VEHICLE PROFILES (MIXED FLEETS)
+# ====================================================================
 
-        return pd.DataFrame(stations)
+VEHICLE_PROFILE_PATH = 'vehicle_profiles.csv'
+DEFAULT_VEHICLE_PROFILE = 'generic_60kwh' # Built from the module constants above
 
-    except requests.exceptions.RequestException as e:
-        # st.error(f"Overpass API Error: {e}") # Debugging removed for clean running
-        return pd.DataFrame()
+VEHICLE_PROFILE_FIELDS = [
+    'battery_kwh', 'vehicle_weight_kg', 'tire_pressure_psi', 'scaling_factor',
+    'min_consumption_kwh_per_km', 'max_consumption_kwh_per_km', 'emission_factor_kg_per_km',
+]
+# Profile field -> prepare_input record key it supplies when the input has no such column
+VEHICLE_PROFILE_INPUTS = {'vehicle_weight_kg': 'Vehicle_Weight_kg', 'tire_pressure_psi': 'Tire_Pressure_psi'}
 
-def calculate_nearest_station_details(stations_df, user_lat, user_lon):
+
+def default_vehicle_profile():
+    defaults = prepare_input(*[None] * len(PREPARE_INPUT_ARGUMENTS))
+    return {
+        'battery_kwh': TOTAL_USABLE_BATTERY_KWH,
+        'vehicle_weight_kg': defaults['Vehicle_Weight_kg'],
+        'tire_pressure_psi': defaults['Tire_Pressure_psi'],
+        'scaling_factor': MODEL_SCALING_FACTOR,
+        'min_consumption_kwh_per_km': MIN_CONSUMPTION_KWH_PER_KM,
+        'max_consumption_kwh_per_km': MAX_CONSUMPTION_KWH_PER_KM,
+        'emission_factor_kg_per_km': EMISSION_FACTOR_KG_PER_KM,
+    }
+
+
+def profile_id_key(profile_id):
     """
-    Calculates distance to the nearest station from the fetched DataFrame.
+    The profile_id string a value refers to. Whole numbers read as floats
+    (pandas does this to a numeric column with blanks) lose their '.0'.
     """
-    if stations_df.empty:
+    if isinstance(profile_id, (float, np.floating)) and float(profile_id).is_integer():
+        return str(int(profile_id))
+    return str(profile_id).strip()
+
+
+class VehicleProfileRegistry:
+    """
+    Vehicle profiles stored column-wise (one float64 array per field, one row
+    per profile_id). lookup() joins a whole column of profile ids to per-row
+    field arrays with one index lookup, so mixed-fleet batches are scored in
+    a single pass.
+    """
+
+    def __init__(self, table):
+        table = table.copy()
+        table.index = table.index.astype(str)
+        missing = [field for field in VEHICLE_PROFILE_FIELDS if field not in table.columns]
+        if missing:
+            raise ValueError(f"Vehicle profiles are missing columns: {', '.join(missing)}")
+        if table.index.has_duplicates:
+            raise ValueError("Vehicle profile ids must be unique.")
+        if DEFAULT_VEHICLE_PROFILE not in table.index:
+            table.loc[DEFAULT_VEHICLE_PROFILE] = default_vehicle_profile()
+
+        self.ids = pd.Index(table.index, name='profile_id')
+        self.columns = {field: table[field].to_numpy(dtype=np.float64) for field in VEHICLE_PROFILE_FIELDS}
+        self._default_code = self.ids.get_loc(DEFAULT_VEHICLE_PROFILE)
+
+    @classmethod
+    def default(cls):
+        return cls(pd.DataFrame([default_vehicle_profile()], index=[DEFAULT_VEHICLE_PROFILE]))
+
+    @classmethod
+    def load(cls, path=VEHICLE_PROFILE_PATH):
+        return cls(pd.read_csv(path, index_col='profile_id', dtype={'profile_id': str}))
+
+    def save(self, path=VEHICLE_PROFILE_PATH):
+        self.to_frame().to_csv(path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+    def to_frame(self):
+        return pd.DataFrame(self.columns, index=self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, profile_id):
+        return profile_id_key(profile_id) in self.ids
+
+    def get(self, profile_id=DEFAULT_VEHICLE_PROFILE):
+        """One profile as a dict of scalars."""
+        return {field: float(values[0]) for field, values in self.lookup([profile_id]).items()}
+
+    def lookup(self, profile_ids):
+        """
+        Per-row field arrays for a sequence of profile ids. Missing ids (None/NaN)
+        use the default profile; unknown ids raise ValueError.
+        """
+        # Each distinct id is normalised once; factorize gives missing ids code -1
+        row_codes, distinct_ids = pd.factorize(pd.Series(profile_ids, dtype=object))
+        keys = [profile_id_key(profile_id) for profile_id in distinct_ids]
+        distinct_codes = self.ids.get_indexer(keys)
+        codes = np.where(row_codes < 0, self._default_code, distinct_codes[row_codes])
+
+        if (distinct_codes < 0).any():
+            unknown = sorted(key for key, code in zip(keys, distinct_codes) if code < 0)
+            raise ValueError(f"Unknown vehicle profiles: {', '.join(unknown[:5])}"
+                             + (f" (+{len(unknown) - 5} more)" if len(unknown) > 5 else ''))
+        return {field: values[codes] for field, values in self.columns.items()}
+
+    @staticmethod
+    def input_defaults(profile):
+        """prepare_input_frame defaults (weight, tire pressure) from a lookup() result."""
+        return {key: profile[field] for field, key in VEHICLE_PROFILE_INPUTS.items()}
+
+
+_vehicle_profiles = None
+_vehicle_profiles_mtime = None
+_vehicle_profiles_lock = threading.Lock()
+
+
+def get_vehicle_profiles(path=VEHICLE_PROFILE_PATH):
+    """
+    Process-wide VehicleProfileRegistry, reloaded when the profile file
+    changes. Falls back to the single default profile when there is no file.
+    """
+    global _vehicle_profiles, _vehicle_profiles_mtime
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    with _vehicle_profiles_lock:
+        if _vehicle_profiles is None or _vehicle_profiles_mtime != mtime:
+            if mtime is None:
+                _vehicle_profiles = VehicleProfileRegistry.default()
+            else:
+                try:
+                    _vehicle_profiles = VehicleProfileRegistry.load(path)
+                except Exception as e:
+                    logger.warning("Could not load vehicle profiles %s: %s", path, e)
+                    return _vehicle_profiles or VehicleProfileRegistry.default()
+            _vehicle_profiles_mtime = mtime
+        return _vehicle_profiles
+
+
+# ====================================================================
+# WHAT-IF SWEEP (SENSITIVITY ANALYSIS)
+# ====================================================================
+
+# prepare_input argument -> (min, max) of its dashboard slider, or the list of categorical levels
+SWEEP_RANGES = {
+    'speed': (20.0, 120.0),
+    'temp': (-5.0, 45.0),
+    'slope': (-5.0, 5.0),
+    'battery_state': (10.0, 100.0),
+    'mode': [1, 2, 3],
+    'road': [1, 2, 3],
+    'traffic': [1, 2, 3],
+}
+
+
+def sweep_axis_values(parameter, n_points=100):
+    """Evenly spaced values over a parameter's full slider range (all levels for categoricals)."""
+    bounds = SWEEP_RANGES[parameter]
+    if isinstance(bounds, list):
+        return np.asarray(bounds)
+    return np.linspace(bounds[0], bounds[1], n_points)
+
+
+def sweep_consumption(base_inputs, loaded_model, x_parameter, x_values, y_parameter=None, y_values=None):
+    """
+    Scores a 1-D or 2-D grid of what-if scenarios in one batched call.
+    base_inputs holds the prepare_input arguments; x (and optionally y) are
+    varied over the given values. Returns (consumption, predicted_range)
+    arrays of shape (len(x_values),) or (len(y_values), len(x_values)).
+    """
+    x_values = np.asarray(x_values)
+    if y_parameter is None:
+        mesh = {x_parameter: x_values}
+        shape = x_values.shape
+    else:
+        y_grid, x_grid = np.meshgrid(np.asarray(y_values), x_values, indexing='ij')
+        mesh = {x_parameter: x_grid.ravel(), y_parameter: y_grid.ravel()}
+        shape = x_grid.shape
+
+    arguments = dict(base_inputs)
+    arguments.update(mesh)
+    n_rows = int(np.prod(shape))
+    arguments = {name: np.broadcast_to(np.asarray(value), (n_rows,)) for name, value in arguments.items()}
+
+    records = pd.DataFrame(prepare_input(**arguments))
+    consumption = predict_energy_consumption_batch(records, loaded_model)
+    predicted_range, _ = calculate_range_metrics_batch(consumption, arguments['battery_state'])
+    return consumption.reshape(shape), predicted_range.reshape(shape)
+
+
+def sweep_slider_ranges(base_inputs, loaded_model, x_parameter, x_points, y_parameter=None, y_points=None):
+    """
+    sweep_consumption over evenly spaced slider values (sweep_axis_values).
+    Returns (x_values, y_values or None, consumption, predicted_range).
+    """
+    x_values = sweep_axis_values(x_parameter, x_points)
+    y_values = sweep_axis_values(y_parameter, y_points) if y_parameter else None
+    consumption, predicted_range = sweep_consumption(
+        base_inputs, loaded_model, x_parameter, x_values, y_parameter, y_values
+    )
+    return x_values, y_values, consumption, predicted_range
+
+
+# ====================================================================
+# TRIP ENERGY SIMULATION (ROUTE PROFILE)
+# ====================================================================
+
+# Used when a segment list leaves a column out (same defaults as the chat assistant)
+SEGMENT_DEFAULTS = {'temp': 25.0, 'mode': 2, 'road': 2, 'traffic': 2, 'slope': 0.0}
+
+
+def simulate_trip(segments, loaded_model, start_soc, battery_kwh=None, soc_passes=2):
+    """
+    Integrates energy use along a route. segments has one row per segment
+    with distance_km and speed (plus optional slope, temp, mode, road,
+    traffic). All segments are scored in one batch; SOC is a model input, so
+    the batch is re-scored with the simulated per-segment SOC soc_passes
+    times. Returns a dict with the per-segment table, totals and the
+    segment/distance where the battery runs out (None if the trip completes).
+    Raises ValueError if a segment has a missing or non-numeric input.
+    """
+    battery_kwh = TOTAL_USABLE_BATTERY_KWH if battery_kwh is None else battery_kwh
+    frame = pd.DataFrame(segments).reset_index(drop=True)
+    for column, default in SEGMENT_DEFAULTS.items():
+        if column not in frame.columns:
+            frame[column] = default
+
+    distance = pd.to_numeric(frame['distance_km'], errors='coerce').to_numpy(dtype=np.float64)
+    frame['battery_state'] = float(start_soc)
+    invalid = invalid_input_rows(prepare_input_frame(frame)) | np.isnan(distance)
+    if invalid.any():
+        raise ValueError(f"{int(invalid.sum())} route segment(s) have a missing or non-numeric input "
+                         f"(first: row {int(np.flatnonzero(invalid)[0])}).")
+
+    available_kwh = battery_kwh * start_soc / 100
+    soc_at_start = np.full(len(frame), float(start_soc))
+
+    for _ in range(max(1, soc_passes)):
+        frame['battery_state'] = np.clip(soc_at_start, 0.0, 100.0)
+        consumption = predict_energy_consumption_batch(prepare_input_frame(frame), loaded_model)
+        energy = consumption * distance
+        cumulative_energy = np.cumsum(energy)
+        # SOC at the start of each segment = start SOC minus energy used by the previous segments
+        soc_at_start = start_soc - np.concatenate(([0.0], cumulative_energy[:-1])) / battery_kwh * 100
+
+    soc_at_end = np.maximum(start_soc - cumulative_energy / battery_kwh * 100, 0.0)
+    soc_at_start = np.maximum(soc_at_start, 0.0)
+    cumulative_distance = np.cumsum(distance)
+
+    # First segment whose cumulative energy exceeds what the battery holds
+    depleted_segment = int(np.searchsorted(cumulative_energy, available_kwh, side='right'))
+    completes_trip = depleted_segment >= len(frame)
+    if completes_trip:
+        depleted_segment = None
+        reachable_km = float(cumulative_distance[-1]) if len(frame) else 0.0
+    else:
+        energy_before = cumulative_energy[depleted_segment - 1] if depleted_segment > 0 else 0.0
+        distance_before = cumulative_distance[depleted_segment - 1] if depleted_segment > 0 else 0.0
+        reachable_km = float(distance_before + (available_kwh - energy_before) / consumption[depleted_segment])
+
+    table = pd.DataFrame({
+        'distance_km': distance,
+        'consumption_kwh_per_km': consumption,
+        'energy_kwh': energy,
+        'cumulative_energy_kwh': cumulative_energy,
+        'cumulative_distance_km': cumulative_distance,
+        'soc_start_%': soc_at_start,
+        'soc_end_%': soc_at_end,
+    })
+
+    return {
+        'segments': table,
+        'total_distance_km': float(cumulative_distance[-1]) if len(frame) else 0.0,
+        'total_energy_kwh': float(cumulative_energy[-1]) if len(frame) else 0.0,
+        'final_soc': float(soc_at_end[-1]) if len(frame) else float(start_soc),
+        'energy_shortfall_kwh': max(float(cumulative_energy[-1]) - available_kwh, 0.0) if len(frame) else 0.0,
+        'completes_trip': completes_trip,
+        'depleted_segment': depleted_segment,
+        'reachable_km': reachable_km,
+        # Emission Offset (Green Skill 1) over the distance actually driven
+        'co2_saved_kg': reachable_km * EMISSION_FACTOR_KG_PER_KM,
+    }
+
+
+# ====================================================================
+# PARALLEL SCORING (PROCESS POOL, MODEL LOADED ONCE PER WORKER)
+# ====================================================================
+
+PARALLEL_CHUNK_SIZE = 20_000
+
+_worker_model = None
+
+
+def init_scoring_worker(pickle_path=LOCAL_FILE_PATH, package_dir=PACKAGED_MODEL_DIR, backend=None):
+    """
+    Process-pool initializer: loads the model once per worker with the same
+    logic as download_file_from_drive (memory-mapped package first, then the
+    pickle), so tasks never carry the model.
+    """
+    global _worker_model, INFERENCE_BACKEND
+    if backend is not None:
+        INFERENCE_BACKEND = backend
+    version = MODEL_REGISTRY.active_version()
+    if version is not None:
+        _worker_model = MODEL_REGISTRY.load(version)
+        LIVE_MODEL.install(version, _worker_model)
+    else:
+        _worker_model = load_model_artifact(pickle_path, package_dir)
+    # Parallelism comes from the pool; nested joblib threads would oversubscribe cores
+    if hasattr(_worker_model, 'n_jobs'):
+        _worker_model.n_jobs = 1
+
+
+def get_worker_model():
+    """The model loaded by init_scoring_worker, or the registry version this worker has swapped to."""
+    return LIVE_MODEL.current(default=_worker_model)
+
+
+def _predict_in_worker(input_records):
+    return predict_energy_consumption_batch(input_records, get_worker_model())
+
+
+class ScoringPool:
+    """
+    A reusable process pool for large batches and what-if sweeps. Records are
+    split into chunks, scored across workers and reassembled in input order.
+    """
+
+    def __init__(self, n_workers=None, chunk_size=PARALLEL_CHUNK_SIZE,
+                 pickle_path=LOCAL_FILE_PATH, package_dir=PACKAGED_MODEL_DIR):
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.n_workers,
+            initializer=init_scoring_worker,
+            initargs=(pickle_path, package_dir, INFERENCE_BACKEND),
+        )
+
+    def predict(self, input_records):
+        """Scaled consumption for every record, same order as input_records."""
+        if not isinstance(input_records, pd.DataFrame):
+            input_records = pd.DataFrame(list(input_records))
+        chunks = [input_records.iloc[start:start + self.chunk_size]
+                  for start in range(0, len(input_records), self.chunk_size)]
+        if not chunks:
+            return np.empty(0, dtype=np.float64)
+        return np.concatenate(list(self._executor.map(_predict_in_worker, chunks)))
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ====================================================================
+# PREDICTION CACHE (QUANTIZED INPUTS, LRU)
+# ====================================================================
+
+USE_PREDICTION_CACHE = True
+PREDICTION_CACHE_SIZE = 4096
+
+# Continuous inputs are rounded to these steps before predicting and caching
+PREDICTION_CACHE_RESOLUTION = {
+    'Speed_kmh': 0.5,
+    'Temperature_C': 0.1,
+    'Slope_%': 0.1,
+    'Battery_State_%': 0.5,
+}
+
+_model_tokens = weakref.WeakKeyDictionary()
+_model_token_counter = itertools.count(1)
+_model_token_lock = threading.Lock()
+
+
+def model_identity(loaded_model):
+    """
+    Returns a process-unique token for a loaded model object. Unlike id(), a
+    token is never reused after the model is garbage collected.
+    """
+    if loaded_model is None:
+        return 0
+    with _model_token_lock:
+        try:
+            token = _model_tokens.get(loaded_model)
+            if token is None:
+                token = next(_model_token_counter)
+                _model_tokens[loaded_model] = token
+            return token
+        except TypeError:
+            # Not weak-referenceable: fall back to the object id
+            return ('id', id(loaded_model))
+
+
+def is_valid_input(input_data_dict):
+    """True when every prepare_input value is numeric (the single-row form of invalid_input_rows)."""
+    try:
+        return not any(np.isnan(float(value)) for value in input_data_dict.values())
+    except (TypeError, ValueError):
+        return False
+
+
+def quantize_input(input_data_dict, resolution=None):
+    """Returns a copy of a prepare_input dict with continuous values rounded to the cache resolution."""
+    resolution = PREDICTION_CACHE_RESOLUTION if resolution is None else resolution
+    quantized = dict(input_data_dict)
+    for key, step in resolution.items():
+        if key in quantized and step:
+            quantized[key] = round(round(float(quantized[key]) / step) * step, 6)
+    return quantized
+
+
+class PredictionCache:
+    """
+    Thread-safe, bounded LRU cache of scaled consumption values keyed on
+    (model identity, quantized prepare_input dict).
+    """
+
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, resolution=None):
+        self.max_size = max_size
+        self.resolution = resolution
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, input_data_dict, loaded_model, compute=None):
+        """
+        Returns the cached consumption for this input, or computes it with
+        compute(quantized_dict, loaded_model) and stores it. Invalid inputs and
+        failed predictions get the fallback (as predict_energy_consumption_local
+        does) and are never cached.
+        """
+        if not is_valid_input(input_data_dict):
+            return predict_energy_consumption_local(input_data_dict, loaded_model)
+        compute = compute or (lambda records, model: float(_predict_scaled_consumption([records], model)[0]))
+        quantized = quantize_input(input_data_dict, self.resolution)
+        key = (model_identity(loaded_model), tuple(sorted(quantized.items())))
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        # Predict outside the lock so slow model calls don't serialize other threads
+        try:
+            value = compute(quantized, loaded_model)
+        except Exception as e:
+            return float(prediction_fallback(1, e)[0])
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, loaded_model):
+        """Drops every entry computed with loaded_model (e.g. after a model swap)."""
+        token = model_identity(loaded_model)
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == token]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Process-wide cache shared by all Streamlit sessions
+PREDICTION_CACHE = PredictionCache()
+
+
+# ====================================================================
+# MODEL REGISTRY (VERSIONED HOT-SWAP)
+# ====================================================================
+
+MODEL_REGISTRY_DIR = 'model_registry' # <version>/ = package_model output, plus registry.json
+MODEL_REGISTRY_MANIFEST = 'registry.json'
+MODEL_REGISTRY_POLL_SECONDS = 5.0 # How often a process re-reads the manifest
+CANARY_ROWS = 256
+CANARY_MAX_MEAN_ABS_DIFF = 0.02 # kWh/km; larger shifts vs the serving model reject the new version
+
+
+def canary_records(n_rows=CANARY_ROWS, seed=0):
+    """Fixed prepare_input rows spread over the dashboard's input ranges."""
+    rng = np.random.default_rng(seed)
+    return [
+        prepare_input(speed, temp, int(mode), int(road), int(traffic), slope, soc)
+        for speed, temp, mode, road, traffic, slope, soc in zip(
+            rng.uniform(20, 120, n_rows), rng.uniform(-5, 45, n_rows), rng.integers(1, 4, n_rows),
+            rng.integers(1, 4, n_rows), rng.integers(1, 4, n_rows), rng.uniform(-5, 5, n_rows), rng.uniform(10, 100, n_rows),
+        )
+    ]
+
+
+def canary_check(candidate_model, serving_model, records=None, max_mean_abs_diff=CANARY_MAX_MEAN_ABS_DIFF):
+    """
+    Scores the canary batch with both models. Returns (passed, report); the
+    candidate fails if it raises, returns non-finite values, or its mean
+    absolute difference from the serving model exceeds max_mean_abs_diff.
+    """
+    feature_matrix = build_feature_matrix(records or canary_records())
+    try:
+        candidate = scale_consumption(predict_raw_consumption(feature_matrix, candidate_model))
+    except Exception as e:
+        return False, {'error': str(e)}
+    if not np.all(np.isfinite(candidate)):
+        return False, {'error': 'non-finite predictions'}
+    if serving_model is None:
+        return True, {'rows': len(candidate), 'mean_consumption': float(candidate.mean())}
+
+    difference = np.abs(candidate - scale_consumption(predict_raw_consumption(feature_matrix, serving_model)))
+    report = {'rows': len(candidate), 'mean_abs_diff': float(difference.mean()), 'max_abs_diff': float(difference.max())}
+    return report['mean_abs_diff'] <= max_mean_abs_diff, report
+
+
+class ModelRegistry:
+    """
+    Directory of versioned model packages. registry.json records every
+    version plus the active and previous one; it is rewritten atomically
+    (temp file + os.replace), so readers see either the old or new state.
+    """
+
+    def __init__(self, root=MODEL_REGISTRY_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, MODEL_REGISTRY_MANIFEST)
+
+    def read_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {'active': None, 'previous': None, 'canary': True, 'versions': {}}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write_manifest(self, manifest):
+        os.makedirs(self.root, exist_ok=True)
+        temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(temp_path, self.manifest_path)
+
+    def manifest_mtime(self):
+        try:
+            return os.stat(self.manifest_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def active_version(self):
+        return self.read_manifest()['active']
+
+    def version_dir(self, version):
+        return os.path.join(self.root, version)
+
+    def publish(self, pickle_path=LOCAL_FILE_PATH, version=None):
+        """Packages a pickled model as a new (inactive) version; returns the version name."""
+        source_sha256 = file_sha256(pickle_path)
+        version = version or f"{time.strftime('%Y%m%d-%H%M%S')}-{source_sha256[:8]}"
+        manifest = self.read_manifest()
+        if version in manifest['versions']:
+            raise ValueError(f"Model version {version} already exists in {self.root}")
+
+        package_model(pickle_path, self.version_dir(version))
+        manifest['versions'][version] = {'source_sha256': source_sha256, 'published_at': time.time()}
+        self._write_manifest(manifest)
+        return version
+
+    def activate(self, version, canary=True):
+        """Makes version the active one; running processes swap to it after their canary check."""
+        manifest = self.read_manifest()
+        if version not in manifest['versions']:
+            raise ValueError(f"Unknown model version {version}")
+        if manifest['active'] != version:
+            manifest['previous'] = manifest['active']
+            manifest['active'] = version
+        manifest['canary'] = canary
+        manifest['versions'][version]['activated_at'] = time.time()
+        self._write_manifest(manifest)
+
+    def rollback(self):
+        """Re-activates the previous version (no canary: it was serving before)."""
+        manifest = self.read_manifest()
+        if not manifest['previous']:
+            raise ValueError("No previous model version to roll back to")
+        self.activate(manifest['previous'], canary=False)
+        return manifest['previous']
+
+    def load(self, version):
+        """Memory-maps a version's package (checksums verified), see load_model_package."""
+        return load_model_package(self.version_dir(version))
+
+
+class LiveModel:
+    """
+    The model this process serves, swapped without a restart when the
+    registry's active version changes. The new version is loaded and canary
+    checked in a background thread while the old one keeps serving; the swap
+    itself is one reference assignment. The replaced model stays in memory so
+    a rollback to it is instant. Cached predictions of a retired model are
+    dropped on every swap.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.version = None
+        self.model = None
+        self.previous = None # (version, model) kept warm for rollback
+        self.rejected = {} # (version, activated_at) -> canary report
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._pending = None # (version, Future)
+        self._seen_mtime = None
+        self._next_poll = 0.0
+
+    def install(self, version, model):
+        """Serves model as version right away (initial load, rollback)."""
+        with self._lock:
+            if self.model is not None and self.version != version:
+                self.previous = (self.version, self.model)
+            retired = self.model
+            self.version, self.model = version, model
+        if retired is not None and retired is not model:
+            PREDICTION_CACHE.invalidate(retired)
+            get_consumption_grid.clear()
+            METRICS.increment('model_swaps_total')
+        logger.info("Serving model version %s", version)
+
+    def current(self, default=None):
+        """The serving model (checks the registry at most every MODEL_REGISTRY_POLL_SECONDS)."""
+        if time.monotonic() >= self._next_poll:
+            self._next_poll = time.monotonic() + MODEL_REGISTRY_POLL_SECONDS
+            self.refresh(default)
+        return self.model if self.model is not None else default
+
+    def refresh(self, serving_model=None):
+        """Starts switching to the registry's active version if it is not the one being served."""
+        with self._refresh_lock:
+            return self._refresh(serving_model)
+
+    def _refresh(self, serving_model):
+        mtime = self.registry.manifest_mtime()
+        if mtime is None or mtime == self._seen_mtime:
+            return
+        self._seen_mtime = mtime
+        manifest = self.registry.read_manifest()
+        version = manifest['active']
+        # A rejection only holds for that activation; re-activating (e.g. with --no-canary) retries
+        activation = (version, manifest['versions'].get(version, {}).get('activated_at')) if version else None
+
+        if version is None or version == self.version or activation in self.rejected:
+            return
+        if self.previous is not None and self.previous[0] == version:
+            METRICS.increment('model_rollbacks_total')
+            self.install(*self.previous)
+            return
+        if self._pending is not None and self._pending[0] == version and not self._pending[1].done():
+            return
+
+        future = Future()
+        self._pending = (version, future)
+        baseline = self.model if self.model is not None else serving_model
+
+        def warm_up():
+            try:
+                candidate = self.registry.load(version)
+                passed, report = canary_check(candidate, baseline) if manifest.get('canary', True) else (True, {})
+                if passed:
+                    self.install(version, candidate)
+                else:
+                    self.rejected[activation] = report
+                    METRICS.increment('model_canary_rejected_total')
+                    logger.warning("Model version %s rejected by canary check: %s", version, report)
+                future.set_result(passed)
+            except Exception as e:
+                # Possibly transient (e.g. files still being copied): retry on the next poll
+                self._seen_mtime = None
+                METRICS.increment('model_load_failed_total')
+                logger.error("Model version %s failed to load: %s", version, e)
+                future.set_exception(e)
+
+        threading.Thread(target=warm_up, name=f"ev-model-{version}", daemon=True).start()
+        return future
+
+
+# Module-level so every Streamlit session in the process serves the same version
+MODEL_REGISTRY = ModelRegistry()
+LIVE_MODEL = LiveModel(MODEL_REGISTRY)
+
+
+# ====================================================================
+# PRECOMPUTED CONSUMPTION GRID (OPTIONAL FAST PATH)
+# ====================================================================
+
+# Set to True to answer dashboard/chat predictions from the precomputed grid
+USE_CONSUMPTION_GRID = False
+GRID_CACHE_DIR = '.'
+
+# Continuous axes follow the Range Predictor slider bounds
+DEFAULT_GRID_AXES = {
+    'Speed_kmh': np.linspace(20, 120, 21),
+    'Temperature_C': np.linspace(-5, 45, 11),
+    'Slope_%': np.linspace(-5, 5, 11),
+    'Battery_State_%': np.linspace(10, 100, 10),
+}
+GRID_CATEGORY_LEVELS = (1, 2, 3) # Driving_Mode, Road_Type, Traffic_Condition
+GRID_CATEGORICAL_KEYS = ['Driving_Mode', 'Road_Type', 'Traffic_Condition']
+GRID_CONTINUOUS_KEYS = list(DEFAULT_GRID_AXES)
+
+
+class ConsumptionGrid:
+    """
+    Model consumption evaluated once over a grid of (mode, road, traffic) x
+    (speed, temp, slope, SOC). Queries use multilinear interpolation on the
+    continuous axes; all other inputs are the prepare_input defaults.
+    """
+
+    def __init__(self, axes, values, model_hash=None, max_error=None):
+        self.axes = {name: np.asarray(points, dtype=np.float64) for name, points in axes.items()}
+        self.values = np.asarray(values, dtype=np.float32)
+        self.model_hash = model_hash
+        self.max_error = max_error
+
+    @classmethod
+    def build(cls, loaded_model, axes=None, model_hash=None, chunk_size=200_000):
+        """Evaluates the model over every grid point with batched predict calls."""
+        axes = axes or DEFAULT_GRID_AXES
+        axis_points = [np.asarray(axes[name], dtype=np.float64) for name in GRID_CONTINUOUS_KEYS]
+        levels = np.asarray(GRID_CATEGORY_LEVELS)
+
+        mesh = np.meshgrid(levels, levels, levels, *axis_points, indexing='ij')
+        flat = {key: m.ravel() for key, m in zip(GRID_CATEGORICAL_KEYS + GRID_CONTINUOUS_KEYS, mesh)}
+        records = pd.DataFrame(prepare_input(
+            speed=flat['Speed_kmh'], temp=flat['Temperature_C'], mode=flat['Driving_Mode'],
+            road=flat['Road_Type'], traffic=flat['Traffic_Condition'],
+            slope=flat['Slope_%'], battery_state=flat['Battery_State_%'],
+        ))
+
+        values = np.empty(len(records), dtype=np.float32)
+        for start in range(0, len(records), chunk_size):
+            chunk = records.iloc[start:start + chunk_size]
+            values[start:start + chunk_size] = predict_energy_consumption_batch(chunk, loaded_model)
+
+        return cls(dict(zip(GRID_CONTINUOUS_KEYS, axis_points)), values.reshape(mesh[0].shape), model_hash)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            axes = {name: data[f"axis_{name}"] for name in GRID_CONTINUOUS_KEYS}
+            max_error = float(data['max_error']) if 'max_error' in data.files else None
+            return cls(axes, data['values'], str(data['model_hash']), max_error)
+
+    def save(self, path):
+        arrays = {f"axis_{name}": points for name, points in self.axes.items()}
+        if self.max_error is not None:
+            arrays['max_error'] = np.float64(self.max_error)
+        np.savez_compressed(path, values=self.values, model_hash=np.str_(self.model_hash or ''), **arrays)
+
+    def lookup(self, speed, temp, mode, road, traffic, slope, battery_state):
+        """
+        Interpolated consumption (kWh/km). Arguments may be scalars or arrays;
+        continuous inputs are clipped to the grid bounds.
+        """
+        continuous = np.broadcast_arrays(*[np.asarray(v, dtype=np.float64) for v in (speed, temp, slope, battery_state)])
+        categorical = np.broadcast_arrays(*[np.asarray(v) for v in (mode, road, traffic)])
+        shape = np.broadcast_shapes(continuous[0].shape, categorical[0].shape)
+
+        # Categorical axes are exact lookups (level 1 -> index 0)
+        cat_idx = [np.broadcast_to(c, shape).astype(np.intp).ravel() - GRID_CATEGORY_LEVELS[0] for c in categorical]
+        if any(((idx < 0) | (idx >= len(GRID_CATEGORY_LEVELS))).any() for idx in cat_idx):
+            raise ValueError("Mode, road and traffic must be one of 1, 2 or 3 for grid lookup.")
+
+        # For each continuous axis: lower cell index and fractional position inside the cell
+        lower, frac = [], []
+        for name, v in zip(GRID_CONTINUOUS_KEYS, continuous):
+            points = self.axes[name]
+            v = np.clip(np.broadcast_to(v, shape).ravel(), points[0], points[-1])
+            i = np.clip(np.searchsorted(points, v, side='right') - 1, 0, len(points) - 2)
+            lower.append(i)
+            frac.append((v - points[i]) / (points[i + 1] - points[i]))
+
+        # Weighted sum over the 2^4 corners of the enclosing cell
+        result = np.zeros(cat_idx[0].shape, dtype=np.float64)
+        for corner in range(1 << len(lower)):
+            weight = np.ones_like(result)
+            idx = list(cat_idx)
+            for axis, (i, t) in enumerate(zip(lower, frac)):
+                upper = (corner >> axis) & 1
+                idx.append(i + upper)
+                weight *= t if upper else (1.0 - t)
+            result += weight * self.values[tuple(idx)]
+
+        return result.reshape(shape) if shape else float(result[0])
+
+    def predict(self, input_data_dict):
+        """Drop-in for predict_energy_consumption_local on a prepare_input dict."""
+        return self.lookup(
+            input_data_dict['Speed_kmh'], input_data_dict['Temperature_C'], input_data_dict['Driving_Mode'],
+            input_data_dict['Road_Type'], input_data_dict['Traffic_Condition'],
+            input_data_dict['Slope_%'], input_data_dict['Battery_State_%'],
+        )
+
+    def measure_max_error(self, loaded_model, n_samples=2000, seed=0):
+        """Max absolute error (kWh/km) vs the live model on random in-range inputs."""
+        rng = np.random.default_rng(seed)
+        bounds = [(self.axes[name][0], self.axes[name][-1]) for name in GRID_CONTINUOUS_KEYS]
+        speed, temp, slope, soc = [rng.uniform(lo, hi, n_samples) for lo, hi in bounds]
+        mode, road, traffic = rng.choice(GRID_CATEGORY_LEVELS, size=(3, n_samples))
+
+        live = predict_energy_consumption_batch(
+            pd.DataFrame(prepare_input(speed, temp, mode, road, traffic, slope, soc)), loaded_model
+        )
+        approx = self.lookup(speed, temp, mode, road, traffic, slope, soc)
+        self.max_error = float(np.max(np.abs(live - approx)))
+        return self.max_error
+
+
+def load_or_build_consumption_grid(loaded_model, model_path=None, axes=None, cache_dir=None):
+    """
+    Returns the ConsumptionGrid for loaded_model, reading the cached .npz
+    (keyed by the hash of the pickle the model came from, or of model_path
+    when given) or building and saving it.
+    """
+    model_hash = file_sha256(model_path) if model_path is not None else model_source_hash(loaded_model)
+    grid_path = os.path.join(cache_dir or GRID_CACHE_DIR, f"ev_consumption_grid_{model_hash[:16]}.npz")
+
+    if os.path.exists(grid_path) and axes is None:
+        return ConsumptionGrid.load(grid_path)
+
+    grid = ConsumptionGrid.build(loaded_model, axes=axes, model_hash=model_hash)
+    grid.measure_max_error(loaded_model)
+    if axes is None:
+        grid.save(grid_path)
+    return grid
+
+
+@st.cache_resource
+def get_consumption_grid(_loaded_model, model_token=None):
+    """
+    Streamlit-cached grid for the loaded model (None if the grid can't be
+    built). model_token (model_identity) keys the cache per model version.
+    """
+    if _loaded_model is None:
+        return None
+    try:
+        return load_or_build_consumption_grid(_loaded_model)
+    except Exception:
+        return None
+
+
+def predict_energy_consumption_fast(input_data_dict, loaded_model):
+    """
+    Uses the precomputed grid when USE_CONSUMPTION_GRID is on, otherwise the
+    live model via predict_energy_consumption_local (memoized in
+    PREDICTION_CACHE when USE_PREDICTION_CACHE is on).
+    """
+    if USE_CONSUMPTION_GRID:
+        grid = get_consumption_grid(loaded_model, model_identity(loaded_model))
+        if grid is not None:
+            return grid.predict(input_data_dict)
+    if USE_PREDICTION_CACHE and loaded_model is not None:
+        return PREDICTION_CACHE.get_or_compute(input_data_dict, loaded_model)
+    return predict_energy_consumption_local(input_data_dict, loaded_model)
+
+
+# ====================================================================
+# CONCURRENT NETWORK I/O (POOLED SESSION, DEADLINES)
+# ====================================================================
+
+HTTP_POOL_SIZE = 16
+IO_WORKERS = 8
+CHAT_TURN_BUDGET_SECONDS = 20.0 # Overall budget for all network calls in one chat turn
+
+_http_session = None
+_io_executor = None
+_io_lock = threading.Lock()
+_current_deadline = contextvars.ContextVar('current_deadline', default=None)
+
+
+class Deadline:
+    """A monotonic time budget shared by every network call made under it."""
+
+    def __init__(self, budget_seconds):
+        self.expires_at = time.monotonic() + budget_seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0.0
+
+
+def http_timeout(default_seconds):
+    """
+    Per-call timeout: default_seconds, shortened to what is left of the
+    active Deadline. Raises TimeoutError if the budget is already spent.
+    """
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return default_seconds
+    remaining = deadline.remaining()
+    if remaining <= 0.0:
+        raise TimeoutError("Chat turn network budget exhausted.")
+    return min(default_seconds, remaining)
+
+
+def get_http_session():
+    """Shared keep-alive requests.Session with a connection pool sized for IO_WORKERS."""
+    global _http_session
+    with _io_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _http_session = session
+        return _http_session
+
+
+def get_io_executor():
+    global _io_executor
+    with _io_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix='ev-io')
+        return _io_executor
+
+
+def submit_io(fn, *args, deadline=None, **kwargs):
+    """Runs fn on the I/O pool with the given Deadline active for its HTTP calls."""
+    context = contextvars.copy_context()
+    if deadline is not None:
+        context.run(_current_deadline.set, deadline)
+    return get_io_executor().submit(context.run, fn, *args, **kwargs)
+
+
+def search_stations_for_location(location_name, radii_km=(15, 5), budget_seconds=None):
+    """
+    One chat turn's network work: geocode location_name, then search the
+    largest radius once and filter the smaller ones locally (concurrent
+    searches would miss the same Overpass tiles at the same time), all
+    within one budget. Returns (lat, lon, address, {radius_km: stations_df});
+    lat is None if geocoding failed or timed out.
+    """
+    deadline = Deadline(CHAT_TURN_BUDGET_SECONDS if budget_seconds is None else budget_seconds)
+
+    try:
+        user_lat, user_lon, full_address = submit_io(
+            get_coordinates_from_query, location_name, deadline=deadline
+        ).result(timeout=deadline.remaining())
+    except Exception:
+        return None, None, None, {}
+
+    if user_lat is None:
+        return None, None, None, {}
+
+    try:
+        widest = submit_io(
+            find_nearest_charging_stations, user_lat, user_lon, max(radii_km), deadline=deadline
+        ).result(timeout=deadline.remaining())
+    except Exception:
+        widest = pd.DataFrame()
+
+    stations = {}
+    for radius in radii_km:
+        if widest.empty or radius == max(radii_km):
+            stations[radius] = widest
+            continue
+        distances = haversine_np(user_lat, user_lon, widest['lat'].to_numpy(), widest['lon'].to_numpy())
+        stations[radius] = widest[distances <= radius].reset_index(drop=True)
+    return user_lat, user_lon, full_address, stations
+
+
+# ====================================================================
+# CHARGING STATION LOGIC (USING OPENSTREETMAP - OVERPASS API) 
+# ====================================================================
+
+OVERPASS_URL = "https://overpass-api.de/api/interpreter" # Changed to HTTPS
+# Point these at a local mock server for offline testing
+NOMINATIM_DOMAIN = "nominatim.openstreetmap.org"
+NOMINATIM_SCHEME = "https"
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Calculates the distance between two points on the earth in kilometers."""
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+HAVERSINE_CHUNK_SIZE = 2048 # rows of the distance matrix computed at a time
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine (km). Inputs are broadcast against each other, so
+    one point vs arrays of stations works directly.
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_matrix(lats1, lons1, lats2, lons2, chunk_size=HAVERSINE_CHUNK_SIZE):
+    """Many-to-many distances (km), shape (len(lats1), len(lats2)), filled chunk by chunk."""
+    lats1, lons1 = np.asarray(lats1, dtype=np.float64), np.asarray(lons1, dtype=np.float64)
+    lats2, lons2 = np.asarray(lats2, dtype=np.float64), np.asarray(lons2, dtype=np.float64)
+
+    out = np.empty((len(lats1), len(lats2)), dtype=np.float64)
+    for start in range(0, len(lats1), chunk_size):
+        stop = start + chunk_size
+        out[start:stop] = haversine_np(lats1[start:stop, np.newaxis], lons1[start:stop, np.newaxis], lats2, lons2)
+    return out
+
+
+def nearest_station_indices(lats, lons, station_lats, station_lons, k=1, chunk_size=HAVERSINE_CHUNK_SIZE):
+    """
+    Top-k nearest stations for many points (e.g. a whole fleet). Returns
+    (indices, distances_km), both shape (n_points, k) and sorted by distance.
+    Only a chunk_size x n_stations block of distances exists at a time.
+    """
+    lats, lons = np.atleast_1d(np.asarray(lats, dtype=np.float64)), np.atleast_1d(np.asarray(lons, dtype=np.float64))
+    station_lats, station_lons = np.asarray(station_lats, dtype=np.float64), np.asarray(station_lons, dtype=np.float64)
+    k = min(k, len(station_lats))
+
+    indices = np.empty((len(lats), k), dtype=np.intp)
+    distances = np.empty((len(lats), k), dtype=np.float64)
+    for start in range(0, len(lats), chunk_size):
+        stop = start + chunk_size
+        block = haversine_np(lats[start:stop, np.newaxis], lons[start:stop, np.newaxis], station_lats, station_lons)
+
+        # argpartition finds the k smallest in O(m); only those k get sorted
+        top = np.argpartition(block, k - 1, axis=1)[:, :k] if k < block.shape[1] else np.tile(np.arange(k), (len(block), 1))
+        top_dist = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(top_dist, axis=1, kind='stable')
+        indices[start:stop] = np.take_along_axis(top, order, axis=1)
+        distances[start:stop] = np.take_along_axis(top_dist, order, axis=1)
+    return indices, distances
+
+
+def find_top_k_stations(stations_df, user_lat, user_lon, k=5):
+    """The k nearest rows of stations_df with an added distance_km column, nearest first."""
+    if stations_df.empty:
+        return stations_df
+    idx, dist = nearest_station_indices(user_lat, user_lon, stations_df['lat'].to_numpy(), stations_df['lon'].to_numpy(), k=k)
+    nearest = stations_df.iloc[idx[0]].copy()
+    nearest['distance_km'] = dist[0]
+    return nearest
+
+
+# --- GEOCODING (NOMINATIM + CACHE) ---
+GEOCODE_CACHE_PATH = 'geocode_cache.sqlite3'
+GEOCODE_CACHE_SIZE = 1024
+GEOCODE_TTL_SECONDS = 30 * 24 * 3600 # Found places rarely move
+GEOCODE_NEGATIVE_TTL_SECONDS = 24 * 3600 # Unknown places are retried after a day
+
+_nominatim_client = None
+
+
+def nominatim_geocode(query, max_attempts=3):
+    """
+    Geocodes with a shared Nominatim client, retrying timeouts/service errors.
+    Returns (lat, lon, address), or (None, None, None) when the place is
+    unknown. Raises the last error if every attempt failed.
+    """
+    global _nominatim_client
+    if _nominatim_client is None:
+        _nominatim_client = geopy_geocoders.Nominatim(user_agent="EV_App_Assistant_V2", domain=NOMINATIM_DOMAIN, scheme=NOMINATIM_SCHEME)
+
+    for attempt in range(max_attempts):
+        try:
+            # Increased timeout for reliability
+            with METRICS.timed('nominatim_request_seconds'):
+                location = _nominatim_client.geocode(query, timeout=http_timeout(10)) 
+            if location:
+                return location.latitude, location.longitude, location.address
+            return None, None, None
+        except (geopy_exc.GeocoderTimedOut, geopy_exc.GeocoderServiceError, requests.exceptions.RequestException):
+            METRICS.increment('nominatim_errors_total')
+            if attempt < max_attempts - 1:
+                time.sleep(1) # Wait before retry
+                continue
+            raise
+
+
+def normalize_location_query(query):
+    return " ".join(str(query).lower().split())
+
+
+class GeocodingCache:
+    """
+    In-memory LRU in front of a SQLite store, with TTLs and negative caching.
+    Concurrent lookups of the same normalized query share one upstream call.
+    geocoder is any callable query -> (lat, lon, address), so tests can pass
+    an offline stub.
+    """
+
+    def __init__(self, geocoder=nominatim_geocode, db_path=GEOCODE_CACHE_PATH, max_size=GEOCODE_CACHE_SIZE,
+                 ttl_seconds=GEOCODE_TTL_SECONDS, negative_ttl_seconds=GEOCODE_NEGATIVE_TTL_SECONDS):
+        self.geocoder = geocoder
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._memory = OrderedDict() # key -> (result, expires_at)
+        self._inflight = {} # key -> Future for the running upstream call
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                "query TEXT PRIMARY KEY, lat REAL, lon REAL, address TEXT, expires_at REAL)"
+            )
+
+    def _remember(self, key, result, expires_at):
+        self._memory[key] = (result, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _read_db(self, key, now):
+        row = self._db.execute("SELECT lat, lon, address, expires_at FROM geocode WHERE query = ?", (key,)).fetchone()
+        if row is None or row[3] <= now:
+            return None
+        return (row[0], row[1], row[2]), row[3]
+
+    def lookup(self, query):
+        key = normalize_location_query(query)
+        now = time.time()
+
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is None or cached[1] <= now:
+                cached = self._read_db(key, now)
+                if cached is not None:
+                    self._remember(key, *cached)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return cached[0]
+
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = tuple(self.geocoder(key))
+        except Exception as e:
+            # Upstream failure: not cached, so the next request tries again
+            METRICS.increment('geocode_failures_total')
+            logger.warning("Geocoding %r failed: %s", key, e)
+            result = (None, None, None)
+            with self._lock:
+                del self._inflight[key]
+            future.set_result(result)
+            return result
+
+        ttl = self.ttl_seconds if result[0] is not None else self.negative_ttl_seconds
+        expires_at = time.time() + ttl
+        with self._lock:
+            self._remember(key, result, expires_at)
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?, ?)", (key, *result, expires_at))
+            del self._inflight[key]
+        future.set_result(result)
+        return result
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'size': len(self._memory),
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_geocode_cache = None
+_geocode_cache_lock = threading.Lock()
+
+
+def get_geocode_cache():
+    """Process-wide GeocodingCache, created on first use."""
+    global _geocode_cache
+    with _geocode_cache_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodingCache()
+        return _geocode_cache
+
+
+def set_geocode_cache(cache):
+    """Replaces the process-wide cache (e.g. with a stub geocoder for offline tests)."""
+    global _geocode_cache
+    with _geocode_cache_lock:
+        _geocode_cache = cache
+
+
+def get_coordinates_from_query(query):
+    """
+    Converts a location query into (lat, lon, address) through the geocoding
+    cache; misses go to Nominatim with retries. Returns (None, None, None) if
+    the place is unknown or the service failed.
+    """
+    with METRICS.timed('geocode_seconds'):
+        return get_geocode_cache().lookup(query)
+
+
+def generate_gmaps_url(query, is_search=False):
+    """Generates a Google Maps URL for the given query (address or search)."""
+    base_url = "https://www.google.com/maps/"
+    if is_search:
+        # For searching 'Charging Stations near Mumbai'
+        return f"https://www.google.com/maps/search/{query.replace(' ', '+')}"
+    else:
+        # For an address/location
+        return f"https://www.google.com/maps/place/{query.replace(' ', '+')}"
+
+
+def parse_overpass_stations(data):
+    """Converts an Overpass JSON response into the Station_Name/lat/lon DataFrame."""
+    stations = []
+    for element in data.get('elements', []):
+        if element.get('type') == 'node':
+            stations.append({
+                'Station_Name': element.get('tags', {}).get('name', 'OSM Station'),
+                'lat': element['lat'],
+                'lon': element['lon']
+            })
+
+    if not stations:
+        return pd.DataFrame()
+
+    return pd.DataFrame(stations)
+
+
+def fetch_stations_from_overpass(user_lat, user_lon, radius_km=5):
+    """
+    Finds charging stations using the free Overpass API (OpenStreetMap data).
+    FIX: Changed Overpass URL to the more robust 'https' version.
+    """
+    radius_meters = radius_km * 1000
+
+    # Overpass QL query: Find nodes with amenity=charging_station around the user location
+    overpass_query = f"""
+    [out:json];
+    node(around:{radius_meters},{user_lat},{user_lon})[amenity=charging_station];
+    out center;
+    """
+
+    try:
+        # Increased timeout for large responses/slow connections
+        with METRICS.timed('overpass_request_seconds'):
+            response = get_http_session().get(OVERPASS_URL, params={'data': overpass_query}, timeout=http_timeout(30)) 
+        response.raise_for_status() 
+        return parse_overpass_stations(response.json())
+
+    except requests.exceptions.RequestException as e:
+        # st.error(f"Overpass API Error: {e}") # Debugging removed for clean running
+        METRICS.increment('overpass_errors_total')
+        logger.warning("Overpass request failed: %s", e)
+        return pd.DataFrame()
+
+
+def fetch_overpass_bbox_json(south, west, north, east, timeout=30):
+    """Raw Overpass JSON for all charging-station nodes inside a bounding box."""
+    overpass_query = f"""
+    [out:json][timeout:{timeout}];
+    node({south},{west},{north},{east})[amenity=charging_station];
+    out;
+    """
+    try:
+        with METRICS.timed('overpass_request_seconds'):
+            response = get_http_session().get(OVERPASS_URL, params={'data': overpass_query}, timeout=http_timeout(timeout + 30))
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException:
+        METRICS.increment('overpass_errors_total')
+        raise
+
+
+def find_nearest_charging_stations(user_lat, user_lon, radius_km=5):
+    """
+    Finds charging stations within radius_km. Answers from the local station
+    store when it is enabled, fresh and covers the point; otherwise from the
+    shared Overpass tile cache (or a direct Overpass query if that is off).
+    """
+    if USE_LOCAL_STATION_STORE:
+        index = get_station_index()
+        if index is not None and not index.is_stale() and index.covers(user_lat, user_lon):
+            METRICS.increment('station_store_queries_total')
+            return index.query_radius(user_lat, user_lon, radius_km)
+
+    if USE_OVERPASS_TILE_CACHE:
+        return OVERPASS_TILE_CACHE.query_radius(user_lat, user_lon, radius_km)
+
+    return fetch_stations_from_overpass(user_lat, user_lon, radius_km)
+
+
+def calculate_nearest_station_details(stations_df, user_lat, user_lon):
+    """
+    Calculates distance to the nearest station from the fetched DataFrame.
+    """
+    if stations_df.empty:
         return "No stations data to calculate distance."
 
-    distances = stations_df.apply(
-        lambda row: haversine(user_lat, user_lon, row['lat'], row['lon']),
-        axis=1
-    )
+    distances = haversine_np(user_lat, user_lon, stations_df['lat'].to_numpy(), stations_df['lon'].to_numpy())
 
-    closest_station_index = distances.idxmin()
-    closest_station = stations_df.loc[closest_station_index]
-    min_distance = distances.min()
+    closest_position = int(np.argmin(distances))
+    closest_station = stations_df.iloc[closest_position]
+    min_distance = distances[closest_position]
 
     # Check if a name tag exists, otherwise use coordinates
     station_name = closest_station['Station_Name'] if closest_station['Station_Name'] != 'OSM Station' else f"Station at ({closest_station['lat']:.2f}, {closest_station['lon']:.2f})"
@@ -254,3 +2269,780 @@ def calculate_nearest_station_details(stations_df, user_lat, user_lon):
     return (f"The nearest charging station found (from OpenStreetMap) is **{station_name}**.\n"
             f"It is approximately **{min_distance:.2f} km** away.")
 
+
+# ====================================================================
+# LOCAL CHARGING STATION STORE (OFFLINE SPATIAL INDEX)
+# ====================================================================
+
+USE_LOCAL_STATION_STORE = True
+STATION_STORE_PATH = 'charging_stations.csv'
+STATION_STORE_MAX_AGE_HOURS = 24 * 7
+
+
+def latlon_to_unit_vectors(lat, lon):
+    """Converts degrees to (n, 3) points on the unit sphere."""
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)])
+
+
+def km_to_chord(distance_km):
+    """Great-circle distance (km) -> straight-line chord length on the unit sphere."""
+    angle = np.minimum(np.asarray(distance_km, dtype=np.float64) / EARTH_RADIUS_KM, np.pi)
+    return 2.0 * np.sin(angle / 2.0)
+
+
+def chord_to_km(chord):
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+class StationIndex:
+    """
+    KD-tree over charging stations on unit-sphere coordinates. Radius and
+    k-nearest queries return the find_nearest_charging_stations schema
+    (Station_Name, lat, lon), ordered by distance.
+    """
+
+    def __init__(self, stations_df, fetched_at=None, bbox=None):
+        self.stations = stations_df.reset_index(drop=True)[['Station_Name', 'lat', 'lon']]
+        self.fetched_at = fetched_at
+        self.bbox = bbox # (south, west, north, east) covered by the extract, if known
+        self._tree = scipy_spatial.cKDTree(latlon_to_unit_vectors(self.stations['lat'], self.stations['lon'])) if len(self.stations) else None
+
+    @classmethod
+    def load(cls, store_path=STATION_STORE_PATH):
+        with open(store_path + '.meta.json') as f:
+            meta = json.load(f)
+        stations_df = pd.read_csv(store_path, dtype={'Station_Name': str}, keep_default_na=False)
+        return cls(stations_df, meta.get('fetched_at'), meta.get('bbox'))
+
+    def __len__(self):
+        return len(self.stations)
+
+    def age_hours(self):
+        if self.fetched_at is None:
+            return float('inf')
+        return (time.time() - self.fetched_at) / 3600.0
+
+    def is_stale(self, max_age_hours=None):
+        return self.age_hours() > (STATION_STORE_MAX_AGE_HOURS if max_age_hours is None else max_age_hours)
+
+    def covers(self, lat, lon):
+        if self.bbox is None:
+            return False # unknown coverage: let the caller fall back to Overpass
+        south, west, north, east = self.bbox
+        return south <= lat <= north and west <= lon <= east
+
+    def query_radius(self, lat, lon, radius_km):
+        if self._tree is None:
+            return pd.DataFrame()
+        point = latlon_to_unit_vectors([lat], [lon])[0]
+        idx = np.asarray(self._tree.query_ball_point(point, float(km_to_chord(radius_km))), dtype=np.intp)
+        if len(idx) == 0:
+            return pd.DataFrame()
+        chord = np.linalg.norm(self._tree.data[idx] - point, axis=1)
+        return self.stations.iloc[idx[np.argsort(chord, kind='stable')]].reset_index(drop=True)
+
+    def query_nearest(self, lat, lon, k=1):
+        if self._tree is None:
+            return pd.DataFrame()
+        k = min(k, len(self.stations))
+        _, idx = self._tree.query(latlon_to_unit_vectors([lat], [lon])[0], k=k)
+        return self.stations.iloc[np.atleast_1d(idx)].reset_index(drop=True)
+
+
+def refresh_station_store(bbox=None, overpass_json_path=None, store_path=STATION_STORE_PATH):
+    """
+    Rebuilds the local station store from a cached Overpass JSON dump, or by
+    downloading every charging station inside bbox (south, west, north, east).
+    With a dump, bbox states the area it was queried for; without one the
+    covered area is taken as the extent of the dump's stations.
+    Returns the number of stations written.
+    """
+    if overpass_json_path is not None:
+        with open(overpass_json_path) as f:
+            data = json.load(f)
+        fetched_at = os.path.getmtime(overpass_json_path)
+    elif bbox is not None:
+        data = fetch_overpass_bbox_json(*bbox, timeout=300)
+        fetched_at = time.time()
+    else:
+        raise ValueError("Provide either a bbox or an Overpass JSON dump to refresh the station store.")
+
+    stations_df = parse_overpass_stations(data)
+    if stations_df.empty:
+        stations_df = pd.DataFrame(columns=['Station_Name', 'lat', 'lon'])
+    elif bbox is None:
+        bbox = (float(stations_df['lat'].min()), float(stations_df['lon'].min()),
+                float(stations_df['lat'].max()), float(stations_df['lon'].max()))
+
+    # Write to temp files first so readers never see a half-written store
+    stations_df.to_csv(store_path + '.tmp', index=False)
+    with open(store_path + '.meta.json.tmp', 'w') as f:
+        json.dump({'fetched_at': fetched_at, 'bbox': list(bbox) if bbox else None, 'count': len(stations_df)}, f)
+    os.replace(store_path + '.tmp', store_path)
+    os.replace(store_path + '.meta.json.tmp', store_path + '.meta.json')
+    return len(stations_df)
+
+
+_station_index = None
+_station_index_mtime = None
+_station_index_lock = threading.Lock()
+
+
+def get_station_index(store_path=STATION_STORE_PATH):
+    """
+    Process-wide StationIndex for the local store, reloaded when the store
+    file changes. Returns None when no store has been built.
+    """
+    global _station_index, _station_index_mtime
+
+    try:
+        mtime = os.path.getmtime(store_path + '.meta.json')
+    except OSError:
+        return None
+
+    with _station_index_lock:
+        if _station_index is None or _station_index_mtime != mtime:
+            try:
+                _station_index = StationIndex.load(store_path)
+                _station_index_mtime = mtime
+            except Exception as e:
+                logger.warning("Could not load station store %s: %s", store_path, e)
+                return None
+        return _station_index
+
+
+# ====================================================================
+# OVERPASS TILE CACHE (SHARED ACROSS SESSIONS)
+# ====================================================================
+
+USE_OVERPASS_TILE_CACHE = True
+OVERPASS_TILE_DEG = 0.1 # ~11 km cells
+OVERPASS_TILE_CACHE_SIZE = 2048 # tiles
+OVERPASS_TILE_TTL_SECONDS = 6 * 3600
+KM_PER_DEG_LAT = 111.32
+
+
+def tiles_for_radius(lat, lon, radius_km, tile_deg=OVERPASS_TILE_DEG):
+    """(row, col) indices of every tile touching the circle's bounding box."""
+    dlat = radius_km / KM_PER_DEG_LAT
+    dlon = radius_km / (KM_PER_DEG_LAT * max(cos(radians(lat)), 0.01))
+    rows = range(int(np.floor((lat - dlat) / tile_deg)), int(np.floor((lat + dlat) / tile_deg)) + 1)
+    cols = range(int(np.floor((lon - dlon) / tile_deg)), int(np.floor((lon + dlon) / tile_deg)) + 1)
+    return [(row, col) for row in rows for col in cols]
+
+
+class OverpassTileCache:
+    """
+    Caches Overpass charging-station results per fixed lat/lon tile. A
+    radius query fetches only its missing tiles (in one bbox request), then
+    filters the union of tiles by exact haversine distance.
+    """
+
+    def __init__(self, fetch_bbox=None, tile_deg=OVERPASS_TILE_DEG, max_tiles=OVERPASS_TILE_CACHE_SIZE,
+                 ttl_seconds=OVERPASS_TILE_TTL_SECONDS):
+        self.fetch_bbox = fetch_bbox or fetch_overpass_bbox_json
+        self.tile_deg = tile_deg
+        self.max_tiles = max_tiles
+        self.ttl_seconds = ttl_seconds
+        self._tiles = OrderedDict() # (row, col) -> (stations DataFrame, expires_at)
+        self._lock = threading.Lock()
+        self.tile_hits = 0
+        self.tile_misses = 0
+        self.fetches = 0
+
+    def _store_tiles(self, missing, stations_df, expires_at):
+        if stations_df.empty:
+            rows = cols = np.empty(0, dtype=np.int64)
+        else:
+            rows = np.floor(stations_df['lat'].to_numpy() / self.tile_deg).astype(np.int64)
+            cols = np.floor(stations_df['lon'].to_numpy() / self.tile_deg).astype(np.int64)
+
+        for tile in missing:
+            # Empty tiles are cached too, so sparse areas aren't refetched
+            tile_df = stations_df[(rows == tile[0]) & (cols == tile[1])] if len(rows) else pd.DataFrame()
+            self._tiles[tile] = (tile_df.reset_index(drop=True), expires_at)
+            self._tiles.move_to_end(tile)
+        while len(self._tiles) > self.max_tiles:
+            self._tiles.popitem(last=False)
+
+    def query_radius(self, user_lat, user_lon, radius_km):
+        tiles = tiles_for_radius(user_lat, user_lon, radius_km, self.tile_deg)
+        now = time.time()
+
+        with self._lock:
+            cached, missing = {}, []
+            for tile in tiles:
+                entry = self._tiles.get(tile)
+                if entry is not None and entry[1] > now:
+                    self._tiles.move_to_end(tile)
+                    cached[tile] = entry[0]
+                else:
+                    missing.append(tile)
+            self.tile_hits += len(cached)
+            self.tile_misses += len(missing)
+
+        if missing:
+            south = min(row for row, _ in missing) * self.tile_deg
+            north = (max(row for row, _ in missing) + 1) * self.tile_deg
+            west = min(col for _, col in missing) * self.tile_deg
+            east = (max(col for _, col in missing) + 1) * self.tile_deg
+            try:
+                fetched = parse_overpass_stations(self.fetch_bbox(south, west, north, east))
+            except requests.exceptions.RequestException:
+                return pd.DataFrame()
+
+            with self._lock:
+                self.fetches += 1
+                self._store_tiles(missing, fetched, time.time() + self.ttl_seconds)
+                for tile in missing:
+                    cached[tile] = self._tiles[tile][0] if tile in self._tiles else pd.DataFrame()
+
+        parts = [df for df in cached.values() if not df.empty]
+        if not parts:
+            return pd.DataFrame()
+
+        candidates = pd.concat(parts, ignore_index=True)
+        distances = haversine_np(user_lat, user_lon, candidates['lat'].to_numpy(), candidates['lon'].to_numpy())
+        inside = np.flatnonzero(distances <= radius_km)
+        if len(inside) == 0:
+            return pd.DataFrame()
+        return candidates.iloc[inside[np.argsort(distances[inside], kind='stable')]].reset_index(drop=True)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.tile_hits + self.tile_misses
+            return {
+                'tile_hits': self.tile_hits,
+                'tile_misses': self.tile_misses,
+                'fetches': self.fetches,
+                'tiles': len(self._tiles),
+                'hit_ratio': self.tile_hits / lookups if lookups else 0.0,
+            }
+
+
+# Module-level so every Streamlit session in the process shares it
+OVERPASS_TILE_CACHE = OverpassTileCache()
+
+
+# ====================================================================
+# CHARGING-STOP PLANNER (A* OVER THE STATION GRAPH)
+# ====================================================================
+
+ROUTE_DETOUR_FACTOR = 1.25 # Road distance / straight-line distance
+CHARGER_POWER_KW = 50.0
+CHARGE_TO_SOC = 80.0 # Charge to this SOC at every stop
+ARRIVAL_RESERVE_SOC = 10.0 # Never plan to arrive below this SOC
+CORRIDOR_FACTOR = 1.5 # Keep stations with d(origin, s) + d(s, dest) <= factor * d(origin, dest)
+
+
+def plan_charging_stops(origin_lat, origin_lon, dest_lat, dest_lon, start_soc, loaded_model,
+                        stations_df=None, speed=80.0, temp=25.0, mode=2, road=1, traffic=2,
+                        charge_to_soc=CHARGE_TO_SOC, reserve_soc=ARRIVAL_RESERVE_SOC,
+                        charger_kw=CHARGER_POWER_KW, corridor_factor=CORRIDOR_FACTOR):
+    """
+    Finds the minimum-time set of charging stops from origin to destination.
+    Every stop charges to charge_to_soc, so each leg's feasibility and cost
+    (drive time + charging time at the leg's end) depend only on its two
+    endpoints, and A* over stations is exact for that policy. Candidate legs
+    come from a KD-tree radius query bounded by the predicted range. Works
+    offline: stations_df defaults to the local station store.
+    Returns a dict with 'feasible', 'stops' (DataFrame), 'total_time_h',
+    'drive_km', 'charge_minutes' and 'arrival_soc' (all None but 'stops'
+    when the destination can't be reached).
+    """
+    if stations_df is None:
+        index = get_station_index()
+        if index is None:
+            raise ValueError("No local station store found. Run refresh_stations.py or pass stations_df.")
+        stations_df = index.stations
+
+    consumption = predict_energy_consumption_local(
+        prepare_input(speed, temp, mode, road, traffic, 0.0, (charge_to_soc + reserve_soc) / 2), loaded_model
+    )
+    kwh_per_straight_km = consumption * ROUTE_DETOUR_FACTOR
+    hours_per_straight_km = ROUTE_DETOUR_FACTOR / speed
+
+    # Only stations inside the origin-destination corridor become graph nodes
+    direct_km = float(haversine_np(origin_lat, origin_lon, dest_lat, dest_lon))
+    if len(stations_df):
+        via_km = (haversine_np(origin_lat, origin_lon, stations_df['lat'].to_numpy(), stations_df['lon'].to_numpy())
+                  + haversine_np(dest_lat, dest_lon, stations_df['lat'].to_numpy(), stations_df['lon'].to_numpy()))
+        candidates = stations_df[via_km <= corridor_factor * max(direct_km, 1.0)].reset_index(drop=True)
+    else:
+        candidates = pd.DataFrame(columns=['Station_Name', 'lat', 'lon'])
+
+    # Node 0 = origin, 1..n = stations, n + 1 = destination
+    lats = np.concatenate(([origin_lat], candidates['lat'].to_numpy(dtype=np.float64), [dest_lat]))
+    lons = np.concatenate(([origin_lon], candidates['lon'].to_numpy(dtype=np.float64), [dest_lon]))
+    destination = len(lats) - 1
+    tree = scipy_spatial.cKDTree(latlon_to_unit_vectors(lats, lons))
+    heuristic = haversine_np(lats, lons, dest_lat, dest_lon) * hours_per_straight_km
+
+    def departure_soc(node):
+        return start_soc if node == 0 else charge_to_soc
+
+    def reach_km(node):
+        usable_kwh = TOTAL_USABLE_BATTERY_KWH * max(departure_soc(node) - reserve_soc, 0.0) / 100
+        return usable_kwh / kwh_per_straight_km
+
+    best_time = {0: 0.0}
+    previous = {0: None}
+    arrival = {0: float(start_soc)}
+    open_heap = [(heuristic[0], 0)]
+    closed = set()
+
+    while open_heap:
+        _, node = heapq.heappop(open_heap)
+        if node in closed:
+            continue
+        closed.add(node)
+        if node == destination:
+            break
+
+        neighbors = np.asarray(tree.query_ball_point(tree.data[node], float(km_to_chord(reach_km(node)))), dtype=np.intp)
+        neighbors = neighbors[neighbors != node]
+        if len(neighbors) == 0:
+            continue
+        leg_km = haversine_np(lats[node], lons[node], lats[neighbors], lons[neighbors])
+        arrival_soc = departure_soc(node) - leg_km * kwh_per_straight_km / TOTAL_USABLE_BATTERY_KWH * 100
+        charge_h = np.where(
+            neighbors == destination, 0.0,
+            np.maximum(charge_to_soc - arrival_soc, 0.0) / 100 * TOTAL_USABLE_BATTERY_KWH / charger_kw,
+        )
+        candidate_time = best_time[node] + leg_km * hours_per_straight_km + charge_h
+
+        for neighbor, new_time, soc in zip(neighbors.tolist(), candidate_time, arrival_soc):
+            if neighbor in closed or new_time >= best_time.get(neighbor, np.inf):
+                continue
+            best_time[neighbor] = float(new_time)
+            previous[neighbor] = node
+            arrival[neighbor] = float(soc)
+            heapq.heappush(open_heap, (new_time + heuristic[neighbor], neighbor))
+
+    if destination not in closed:
+        return {'feasible': False, 'stops': pd.DataFrame(), 'total_time_h': None,
+                'drive_km': None, 'charge_minutes': None, 'arrival_soc': None}
+
+    path = []
+    node = destination
+    while node is not None:
+        path.append(node)
+        node = previous[node]
+    path.reverse()
+
+    stop_nodes = path[1:-1]
+    stops = candidates.iloc[[node - 1 for node in stop_nodes]].reset_index(drop=True)
+    stops['arrival_soc'] = [arrival[node] for node in stop_nodes]
+    stops['departure_soc'] = charge_to_soc
+    stops['charge_minutes'] = [max(charge_to_soc - arrival[node], 0.0) / 100 * TOTAL_USABLE_BATTERY_KWH / charger_kw * 60
+                               for node in stop_nodes]
+    drive_km = float(sum(haversine_np(lats[a], lons[a], lats[b], lons[b]) for a, b in zip(path, path[1:]))) * ROUTE_DETOUR_FACTOR
+
+    return {
+        'feasible': True,
+        'stops': stops,
+        'total_time_h': best_time[destination],
+        'drive_km': drive_km,
+        'charge_minutes': float(stops['charge_minutes'].sum()) if len(stops) else 0.0,
+        'arrival_soc': arrival[destination],
+    }
+
+
+# ====================================================================
+# CHAT INTENT ROUTING (SMART ASSISTANT)
+# ====================================================================
+
+# Keyword -> flags it sets, matched as substrings of the lowercased prompt (as
+# the assistant's original any(keyword in prompt_lower ...) checks did)
+CHAT_KEYWORDS = {
+    'doubt_slope': ["slope", "road slope", "incline", "dhalan"],
+    'doubt_soc': ["soc", "battery state", "battery percentage", "range"],
+    'doubt_consumption': ["consumption", "kwh/km", "average"],
+    'doubt_road_type': ["road type", "highway", "urban", "rural"],
+    'model_features': ["model features", "what is this model", "inputs", "dashboard parameters", "what are features"],
+    'nearest': ["nearest"],
+    'station': ["station", "charger", "map"],
+    'prediction': ["predict", "range", "consumption"],
+    'eco': ["eco"],
+    'sport': ["sport"],
+    'highway': ["highway"],
+    'rural': ["rural"],
+}
+CHAT_KEYWORD_TABLE = {word: frozenset(flag for flag, words in CHAT_KEYWORDS.items() if word in words)
+                      for words in CHAT_KEYWORDS.values() for word in words}
+
+# Intent dispatch, in the assistant's priority order: first rule whose flags are all set wins
+CHAT_INTENT_RULES = [
+    ('doubt_slope', {'doubt_slope'}),
+    ('doubt_soc', {'doubt_soc'}),
+    ('doubt_consumption', {'doubt_consumption'}),
+    ('doubt_road_type', {'doubt_road_type'}),
+    ('model_features', {'model_features'}),
+    ('nearest_station', {'nearest', 'station'}),
+    ('prediction', {'prediction'}),
+]
+
+# Slot patterns (the assistant's original ones), compiled once and only run for the intent that uses them
+CHAT_SPEED_PATTERN = re.compile(r'(\d+)\s*km/?h|at\s*(\d+)')
+CHAT_SOC_PATTERN = re.compile(r'(\d+)\s*%')
+CHAT_SLOPE_PATTERN = re.compile(r'slope\s*(\-?\+?\d+\.?\d*)')
+CHAT_LOCATION_PATTERN = re.compile(r'near\s+(.+)')
+CHAT_SLOT_DEFAULTS = {'speed': 60.0, 'soc': 75.0, 'slope': 0.0, 'mode': 2, 'road': 2, 'location': None}
+CHAT_INTENT_SLOTS = {
+    'prediction': ('speed', 'soc', 'slope', 'mode', 'road'),
+    'nearest_station': ('location',),
+}
+
+
+def route_prompt(prompt):
+    """
+    Intent and slots (speed, soc, slope, mode, road, location) of one chat
+    prompt, as a dict. The keyword table is scanned once for the flags the
+    prompt sets; the first matching CHAT_INTENT_RULES entry is the intent
+    ('fallback' if none). Slots an intent does not use keep their defaults.
+    """
+    prompt_lower = str(prompt).lower()
+    flags = set()
+    for keyword, keyword_flags in CHAT_KEYWORD_TABLE.items():
+        if keyword in prompt_lower:
+            flags |= keyword_flags
+
+    intent = next((intent for intent, required in CHAT_INTENT_RULES if required <= flags), 'fallback')
+    route = {'intent': intent, **CHAT_SLOT_DEFAULTS}
+
+    if intent == 'prediction':
+        speed_match = CHAT_SPEED_PATTERN.search(prompt_lower)
+        battery_match = CHAT_SOC_PATTERN.search(prompt_lower)
+        slope_match = CHAT_SLOPE_PATTERN.search(prompt_lower)
+        if speed_match:
+            route['speed'] = float(speed_match.group(1) or speed_match.group(2))
+        if battery_match:
+            route['soc'] = float(battery_match.group(1))
+        if slope_match:
+            try:
+                route['slope'] = float(slope_match.group(1))
+            except ValueError: # e.g. "slope -+5"
+                pass
+        route['mode'] = 1 if 'eco' in flags else 3 if 'sport' in flags else 2
+        route['road'] = 1 if 'highway' in flags else 3 if 'rural' in flags else 2
+    elif intent == 'nearest_station':
+        location_match = CHAT_LOCATION_PATTERN.search(prompt_lower)
+        if location_match:
+            route['location'] = location_match.group(1).strip()
+    return route
+
+
+def route_prompts(prompts):
+    """route_prompt for a batch of prompts, as a DataFrame with one row per prompt."""
+    routes = [route_prompt(prompt) for prompt in prompts]
+    columns = {key: [route[key] for route in routes] for key in ['intent', *CHAT_SLOT_DEFAULTS]}
+    columns['location'] = pd.Series(columns['location'], dtype=object) # keep None (not NaN) for prompts without one
+    return pd.DataFrame(columns)
+
+
+def iter_chat_prompts(path):
+    """
+    User prompts from a chat log: .jsonl (objects with 'prompt', or
+    role/content messages, of which only role 'user' is kept), .csv (a
+    'prompt' column) or plain text with one prompt per line.
+    """
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, usecols=['prompt'], keep_default_na=False)['prompt']
+        return
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip('\n')
+            if not path.endswith('.jsonl'):
+                if line:
+                    yield line
+                continue
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'prompt' in record:
+                yield record['prompt']
+            elif record.get('role') == 'user':
+                yield record['content']
+
+
+# ====================================================================
+# CHAT RESPONSES (HEADLESS ENGINE)
+# ====================================================================
+
+# Explanations for specific dashboard parameters, keyed by routed intent
+CHAT_DOUBT_RESPONSES = {
+    'doubt_slope': ("**🛣️ Road Slope (%)**: This describes the steepness of the road.\n"
+                    "* **Positive Slope (+5%)** means **driving uphill**, which increases energy usage.\n"
+                    "* **Negative Slope (-5%)** means **driving downhill**, where regenerative braking can **recover** energy.\n"
+                    "* **0%** means a **flat road**."),
+    'doubt_soc': ("**🔋 Battery State of Charge (SOC) %**: This is the remaining percentage of energy in your battery, used to calculate your remaining driving range."),
+    'doubt_consumption': ("**⚡ Energy Consumption (kWh/km)**: This is the core output—the energy (kWh) the car uses per kilometer. **Lower is always better**."),
+    'doubt_road_type': ("*Road Type: This categorizes the driving environment: **1: Highway, **2: Urban*, *3: Rural*. Each affects typical speed and traffic conditions."),
+}
+
+CHAT_MODEL_FEATURES_RESPONSE = """
+**EV Range Prediction Model Features and Inputs**
+
+Our prediction model is based on a generic **60 kWh Long-Range Electric Vehicle (EV)**. Its purpose is to estimate the most accurate energy consumption (kWh/km) for your journey based on your current driving conditions.
+
+Based on this estimate, your **Approx. Predicted Range, Emission Offset, and Driving Efficiency** are calculated.
+
+---
+
+**🔍 Key Inputs (Which You Can Change on the Dashboard):**
+1. **Average Speed (km/h):** Higher speed typically increases energy consumption.
+2. **Driving Mode:** Eco (lowest consumption), Normal, and Sport (highest consumption).
+3. **Road Type:** Highway (constant speed, higher energy use) or Urban (stop-and-go, allows for regenerative braking).
+4. **Traffic Condition:** Low, Medium, or High (more idling and braking in high traffic).
+5. **Road Slope (%):** Uphill driving increases energy use; downhill allows energy recovery via regen braking.
+6. **Outside Temperature (°C):** Extreme temperatures (very hot or very cold) affect battery performance.
+7. **Current Battery State (SOC %):** The remaining energy percentage in your battery.
+
+---
+
+**🚗 Fixed Model Specifications (Default Values):**
+* **Usable Battery Capacity:** 60.0 kWh
+* **Vehicle Weight (Approx):** 2100 kg
+* **Max Theoretical Range:** $\\approx 500 \\text{ km}$ (at 100% SOC, under ideal conditions)
+
+---
+
+**🔌 Charging Station Logic:**
+
+For charging station information, we use **OpenStreetMap (Overpass API)**.
+* It searches for all **EV Charging Stations** within a **15 km** radius of the location you provide.
+* It provides the name of the nearest station and the approximate distance **(km)**.
+"""
+
+CHAT_LOCATION_REQUIRED_RESPONSE = (
+    "**🌎 Location Required!**\n\n"
+    "Please enter the **city or area name** for the search, like:\n"
+    "👉 **`Find nearest charging station near Mumbai`**"
+)
+CHAT_FALLBACK_RESPONSE = "I'm sorry, I can only answer questions related to the **EV model features**, **predict range**, or **find the nearest charging station near [City Name]**."
+
+
+def format_prediction_response(route, consumption, predicted_range, co2_saved_kg):
+    """Assistant reply for one routed prediction prompt."""
+    if consumption <= 0.0001:
+        return "Consumption calculation failed (returned zero). Please adjust inputs or check model data."
+
+    slope_analysis = f", Slope: **{route['slope']}%**" if route['slope'] != 0.0 else ""
+
+    return (f"**✅ Prediction Complete**\n\n"
+            f"Based on: *Speed: {route['speed']} km/h, Battery: {route['soc']}%{slope_analysis}, Mode: {route['mode']}*.\n\n"
+            f"*Predicted Consumption*: **{consumption:.3f} kWh/km**\n"
+            f"*Predicted Range*: **{predicted_range:.0f} km**\n"
+            f"*Green Skill: You are saving **{co2_saved_kg:.1f} kg CO2** on this range.")
+
+
+def predict_chat_routes(routes, loaded_model):
+    """
+    Reply texts for routed prediction prompts (a route_prompts frame), from
+    one batched model call. A single prompt goes through
+    predict_energy_consumption_fast so the dashboard grid/cache still apply.
+    """
+    if loaded_model is None:
+        return ["Model failed to load, prediction cannot be performed."] * len(routes)
+
+    try:
+        records = [prepare_input(speed=route.speed, temp=25.0, mode=route.mode, road=route.road, traffic=2,
+                                 slope=route.slope, battery_state=route.soc)
+                   for route in routes.itertuples(index=False)] # Default Temp and Traffic
+        if len(records) == 1:
+            consumption = np.array([predict_energy_consumption_fast(records[0], loaded_model)])
+        else:
+            consumption = predict_energy_consumption_batch(records, loaded_model)
+        predicted_range, co2_saved_kg = calculate_range_metrics_batch(consumption, routes['soc'].to_numpy())
+    except Exception:
+        return ["Sorry, I could not find enough parameters (Speed and Battery %) in your query to run the prediction model. Please provide them explicitly."] * len(routes)
+
+    return [format_prediction_response(route, c, r, co2)
+            for route, c, r, co2 in zip(routes.to_dict('records'), consumption, predicted_range, co2_saved_kg)]
+
+
+def station_search_response(location_name, search_result):
+    """
+    Reply for a nearest-station prompt from a search_stations_for_location
+    result: (text, 15 km stations frame or None, nearest station details).
+    """
+    user_lat, user_lon, full_address, stations_by_radius = search_result
+    gmaps_url = generate_gmaps_url(f"EV Charging Stations near {location_name.title()}", is_search=True)
+
+    if user_lat is None:
+        # Geocoding failed
+        return (
+            f"❌ Sorry, I couldn't find the coordinates for **{location_name.title()}**. Please try a different name or a major city.\n\n"
+            f"**Tip:** You can search directly on [Google Maps]({gmaps_url})."
+        ), None, None
+
+    # NOTE: The nearest station uses the 5 km search; the 15 km one is shown on the map.
+    stations_df = stations_by_radius.get(15, pd.DataFrame())
+    if stations_df.empty:
+        # No stations found via OSM, but location was valid (Direct Google Maps Link)
+        return (
+            f"**⚠️ Search Result:** No free charging stations were found in the 15 km radius around **{location_name.title()}** based on OpenStreetMap (OSM) data.\n\n"
+            f"**View Now:** You can instantly see all available charging stations (public, private, etc.) in this area directly on Google Maps.\n"
+            f"**➡️ [Search Charging Stations on Google Maps]({gmaps_url})**"
+        ), None, None
+
+    nearest_details = calculate_nearest_station_details(stations_by_radius.get(5, pd.DataFrame()), user_lat, user_lon)
+    return (
+        f"Here are the stations I found based on the 15 km search radius around **{location_name.title()}**.\n\n"
+        f"**🗺️ External Map Link:**\n"
+        f"If you want to see more options, click here: "
+        f"**➡️ [Search Charging Stations on Google Maps]({gmaps_url})**"
+    ), stations_df, nearest_details
+
+
+def respond_to_prompts(prompts, loaded_model=None, load_model=None):
+    """
+    Headless Smart Assistant: replies to a batch of prompts, in order.
+    Prompts are routed in one pass, every prediction prompt is scored in one
+    model call, and each unique location is geocoded and searched once.
+    load_model (e.g. download_file_from_drive) is only called when a prompt
+    needs a prediction and loaded_model is None.
+
+    Returns one dict per prompt: intent, response, location, stations (the
+    15 km stations frame for the map, or None) and nearest (details text).
+    """
+    prompts = list(prompts)
+    routes = route_prompts(prompts)
+    intents = routes['intent'].to_numpy()
+    responses = [None] * len(prompts)
+    stations = [None] * len(prompts)
+    nearest = [None] * len(prompts)
+
+    for i, intent in enumerate(intents):
+        if intent in CHAT_DOUBT_RESPONSES:
+            responses[i] = CHAT_DOUBT_RESPONSES[intent]
+        elif intent == 'model_features':
+            responses[i] = CHAT_MODEL_FEATURES_RESPONSE
+        elif intent == 'fallback':
+            responses[i] = CHAT_FALLBACK_RESPONSE
+
+    predictions = np.flatnonzero(intents == 'prediction')
+    if len(predictions):
+        if loaded_model is None and load_model is not None:
+            loaded_model = load_model()
+        for i, text in zip(predictions, predict_chat_routes(routes.iloc[predictions], loaded_model)):
+            responses[i] = text
+
+    searches = {}
+    for i in np.flatnonzero(intents == 'nearest_station'):
+        location_name = routes.at[i, 'location']
+        if not location_name:
+            # User asked for charging station without specifying location (PROMPT THE USER)
+            responses[i] = CHAT_LOCATION_REQUIRED_RESPONSE
+            continue
+        if location_name not in searches:
+            # Geocode, then one 15 km station search (the 5 km list is filtered from it) within one network budget
+            searches[location_name] = station_search_response(
+                location_name, search_stations_for_location(location_name, radii_km=(15, 5))
+            )
+        responses[i], stations[i], nearest[i] = searches[location_name]
+
+    return [
+        {'intent': intent, 'response': response, 'location': location, 'stations': stations_df, 'nearest': details}
+        for intent, response, location, stations_df, details
+        in zip(intents.tolist(), responses, routes['location'].tolist(), stations, nearest)
+    ]
+
+
+def respond_to_prompt(prompt, loaded_model=None, load_model=None):
+    """respond_to_prompts for a single prompt (the Smart Assistant page)."""
+    return respond_to_prompts([prompt], loaded_model, load_model)[0]
+
+
+# ====================================================================
+# CHAT HISTORY (BOUNDED SESSION STORE)
+# ====================================================================
+
+CHAT_HISTORY_DIR = 'chat_history' # One <session id>.jsonl per session for paged-out messages
+CHAT_HISTORY_WINDOW = 20 # Messages kept in memory and re-rendered on every rerun
+CHAT_MAP_CACHE_SIZE = 4 # Station maps kept per session (most recently shown)
+
+
+class ChatHistory:
+    """
+    Bounded chat transcript for one Streamlit session. The last `window`
+    messages are kept in memory as compact (role, content, map key) tuples;
+    older ones are appended to a per-session JSON-lines log on disk, so memory
+    and rerun cost stay flat however long the conversation gets. Station map
+    frames are cached per location (lat/lon only) instead of rebuilt.
+    """
+
+    ROLES = ('user', 'assistant')
+
+    def __init__(self, session_id=None, window=CHAT_HISTORY_WINDOW, history_dir=CHAT_HISTORY_DIR,
+                 map_cache_size=CHAT_MAP_CACHE_SIZE):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.window = window
+        self.path = os.path.join(history_dir, f"{self.session_id}.jsonl")
+        self.recent = deque(maxlen=window)
+        self.paged_out = [0] * len(self.ROLES) # per role
+        self.maps = OrderedDict() # map key -> DataFrame(latitude, longitude)
+        self.map_cache_size = map_cache_size
+
+    def __len__(self):
+        return sum(self.paged_out) + len(self.recent)
+
+    def append(self, role, content, map_key=None):
+        if len(self.recent) == self.window:
+            self._page_out(self.recent[0])
+        self.recent.append((self.ROLES.index(role), content, map_key))
+
+    def _page_out(self, message):
+        role, content, map_key = message
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps({'role': self.ROLES[role], 'content': content, 'map': map_key}, ensure_ascii=False) + "\n")
+        self.paged_out[role] += 1
+
+    def messages(self):
+        """The in-memory window as role/content/map dicts, oldest first."""
+        return [{'role': self.ROLES[role], 'content': content, 'map': map_key} for role, content, map_key in self.recent]
+
+    def summary(self):
+        """One line describing the paged-out messages, or None if there are none."""
+        if not sum(self.paged_out):
+            return None
+        questions = self.paged_out[self.ROLES.index('user')]
+        return f"{sum(self.paged_out)} earlier messages ({questions} questions)"
+
+    def load_paged(self, limit=None):
+        """Paged-out messages from disk, oldest first (only the last `limit` if given)."""
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, encoding='utf-8') as f:
+            lines = deque(f, maxlen=limit)
+        return [json.loads(line) for line in lines]
+
+    def add_map(self, key, stations_df):
+        """Caches the map frame for key; returns it (latitude/longitude columns for st.map)."""
+        frame = pd.DataFrame({
+            'latitude': stations_df['lat'].to_numpy(dtype=np.float32),
+            'longitude': stations_df['lon'].to_numpy(dtype=np.float32),
+        })
+        self.maps[key] = frame
+        self.maps.move_to_end(key)
+        while len(self.maps) > self.map_cache_size:
+            self.maps.popitem(last=False)
+        return frame
+
+    def map_for(self, key):
+        """Cached map frame for key, or None once it has been evicted."""
+        frame = self.maps.get(key)
+        if frame is not None:
+            self.maps.move_to_end(key)
+        return frame
+
+
+record_startup('import common_functions', time.perf_counter() - _module_import_started)
+
+# Opt-in metrics endpoint, e.g. EV_METRICS_PORT=9108 streamlit run streamlit_app.py
+if os.environ.get('EV_METRICS_PORT'):
+    start_metrics_server(os.environ['EV_METRICS_PORT'])
@@ -0,0 +1,82 @@
+# model_registry.py
+# Manages the versioned model registry (model_registry/ by default). Running
+# app and batch-scoring processes pick up a newly activated version without a
+# restart: they warm it up in the background, check a canary batch against
+# the version they are serving, and then swap.
+#
+# Usage:
+#   python model_registry.py publish ev_energy_consumption_model.pkl --activate
+#   python model_registry.py list
+#   python model_registry.py canary 20261017-101500-1a2b3c4d   # check against the active version
+#   python model_registry.py activate 20261017-101500-1a2b3c4d [--no-canary]
+#   python model_registry.py rollback
+
+import argparse
+import time
+
+import common_functions as cf
+
+
+def print_versions(registry):
+    manifest = registry.read_manifest()
+    for version, entry in sorted(manifest['versions'].items(), key=lambda item: item[1]['published_at']):
+        marker = 'active' if version == manifest['active'] else 'previous' if version == manifest['previous'] else ''
+        published = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(entry['published_at']))
+        print(f"{version:<32} {published}  sha256 {entry['source_sha256'][:12]}  {marker}")
+
+
+def run_canary(registry, version):
+    active = registry.active_version()
+    serving = registry.load(active) if active is not None else None
+    passed, report = cf.canary_check(registry.load(version), serving)
+    print(f"Canary {version} vs {active}: {'passed' if passed else 'FAILED'} {report}")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish, activate and roll back model versions.")
+    parser.add_argument('--root', default=cf.MODEL_REGISTRY_DIR, help="Registry directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    publish = commands.add_parser('publish', help="Package a pickled model as a new version")
+    publish.add_argument('pickle', nargs='?', default=cf.LOCAL_FILE_PATH)
+    publish.add_argument('--version', help="Version name (default: timestamp + source hash)")
+    publish.add_argument('--activate', action='store_true', help="Activate it if the canary check passes")
+
+    activate = commands.add_parser('activate', help="Make a version active")
+    activate.add_argument('version')
+    activate.add_argument('--no-canary', action='store_true', help="Running processes swap without a canary check")
+
+    canary = commands.add_parser('canary', help="Check a version against the active one")
+    canary.add_argument('version')
+
+    commands.add_parser('rollback', help="Re-activate the previous version")
+    commands.add_parser('list', help="List versions")
+    args = parser.parse_args()
+
+    registry = cf.ModelRegistry(args.root)
+
+    if args.command == 'publish':
+        version = registry.publish(args.pickle, args.version)
+        print(f"Published {version}")
+        if args.activate:
+            if not run_canary(registry, version):
+                raise SystemExit(1)
+            registry.activate(version)
+            print(f"Activated {version}")
+    elif args.command == 'activate':
+        if not args.no_canary and not run_canary(registry, args.version):
+            raise SystemExit(1)
+        registry.activate(args.version, canary=not args.no_canary)
+        print(f"Activated {args.version}")
+    elif args.command == 'canary':
+        if not run_canary(registry, args.version):
+            raise SystemExit(1)
+    elif args.command == 'rollback':
+        print(f"Rolled back to {registry.rollback()}")
+    else:
+        print_versions(registry)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+# package_model.py
+# Converts ev_energy_consumption_model.pkl into the memory-mappable package
+# used by common_functions.load_model_artifact.
+#
+# Usage: python package_model.py [--pickle PATH] [--out DIR]
+
+import argparse
+import time
+
+import common_functions as cf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Package the EV model for fast, memory-mapped loading.")
+    parser.add_argument('--pickle', default=cf.LOCAL_FILE_PATH, help="Source pickle file")
+    parser.add_argument('--out', default=cf.PACKAGED_MODEL_DIR, help="Output package directory")
+    args = parser.parse_args()
+
+    manifest = cf.package_model(args.pickle, args.out)
+    for name, digest in manifest['files'].items():
+        print(f"{name}: sha256 {digest}")
+
+    start = time.perf_counter()
+    model = cf.load_model_package(args.out)
+    print(f"Verified load from {args.out} in {time.perf_counter() - start:.3f} s ({type(model).__name__})")
+
+    # Only an exact flat-array export is served from the memory-mapped node arrays
+    difference = manifest['flat_forest_max_abs_difference']
+    print(f"Flat forest max abs difference vs model.predict: {difference}")
+    if difference != 0.0:
+        print("Flat forest export does not match the model; the package will be served with scikit-learn.")
+
+
+if __name__ == '__main__':
+    main()
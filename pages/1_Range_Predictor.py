@@ -4,9 +4,21 @@
 import streamlit as st
 import common_functions as cf
 import pandas as pd 
+import numpy as np
+import altair as alt
+
+# --- 2. MODEL LOADING (background warm-up; waited for just before prediction) ---
+cf.start_model_warmup()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def cached_sweep(model_token, base_items, x_parameter, x_points, y_parameter=None, y_points=None, _loaded_model=None):
+    """
+    Streamlit-cached cf.sweep_slider_ranges, keyed on the model identity and
+    the exact input combination (base_items is a sorted tuple of base inputs).
+    """
+    return cf.sweep_slider_ranges(dict(base_items), _loaded_model, x_parameter, x_points, y_parameter, y_points)
 
-# --- 2. MODEL LOADING ---
-model = cf.download_file_from_drive()
 
 # --- 3. PAGE CONFIGURATION (Simple Configuration) ---
 st.set_page_config(
@@ -66,6 +78,8 @@ div.stAlert.st-info {
 st.sidebar.header("📊 Model Performance (RFR)")
 st.sidebar.metric("R² Score (Accuracy)", "0.9997", "Excellent")
 st.sidebar.metric("Mean Absolute Error (MAE)", "0.0076 kWh", "Very Low")
+show_interval = st.sidebar.checkbox("Show prediction interval (tree spread)", key='show_interval',
+                                    help="Min/expected/max range from the 5th-95th percentile of the forest's individual trees.")
 st.sidebar.subheader("Driving Mode Mapping")
 st.sidebar.markdown("1: Eco | 2: Normal | 3: Sport")
 
@@ -96,6 +110,8 @@ with col3:
     traffic_condition = traffic_options[traffic_condition_name]
     
 # --- 7. PREDICTION LOGIC ---
+model = cf.download_file_from_drive()
+
 if st.button("Predict Range & Green Impact", key='predict_btn', use_container_width=True):
     
     if model is not None:
@@ -103,7 +119,7 @@ if st.button("Predict Range & Green Impact", key='predict_btn', use_container_wi
             
             # 1. Current Mode Prediction
             input_data_dict = cf.prepare_input(speed, temp, driving_mode, road_type, traffic_condition, slope, current_soc)
-            consumption_current = cf.predict_energy_consumption_local(input_data_dict, model)
+            consumption_current = cf.predict_energy_consumption_fast(input_data_dict, model)
             
             # Green Skills Logic (Call from common_functions)
             predicted_range_current, co2_saved_kg = cf.calculate_range_metrics(consumption_current, current_soc)
@@ -127,6 +143,24 @@ if st.button("Predict Range & Green Impact", key='predict_btn', use_container_wi
             # Display Driving Efficiency 
             colD.metric("Driving Efficiency", f"{100 - (consumption_current * 100):.1f} %", "High Score!")
             
+            # Prediction interval from the spread of the individual trees (one pass over all trees)
+            if show_interval:
+                # Centred on the headline value above, so it always lies inside its interval
+                consumption_bounds = cf.center_interval(
+                    cf.predict_energy_consumption_interval([input_data_dict], model), consumption_current)
+                range_min, range_expected, range_max, _ = cf.calculate_range_interval(
+                    [bounds[0] for bounds in consumption_bounds], current_soc)
+                low_pct, high_pct = (int(q * 100) for q in cf.PREDICTION_INTERVAL)
+
+                st.markdown("---")
+                st.subheader(f"🎯 Range Interval ({low_pct}th-{high_pct}th Percentile of Trees)")
+                colI1, colI2, colI3 = st.columns(3)
+                colI1.metric("Min Range", f"{range_min:.0f} km", f"{range_min - range_expected:.0f} km")
+                colI2.metric("Expected Range", f"{range_expected:.0f} km")
+                colI3.metric("Max Range", f"{range_max:.0f} km", f"+{range_max - range_expected:.0f} km")
+                st.caption(f"Consumption: {consumption_bounds[0][0]:.4f} - {consumption_bounds[2][0]:.4f} kWh/km "
+                           f"(expected {consumption_bounds[1][0]:.4f}).")
+
             st.markdown("---")
             st.subheader("💡 Green Skill Analysis (Approximate Values)")
 
@@ -140,7 +174,7 @@ if st.button("Predict Range & Green Impact", key='predict_btn', use_container_wi
             if driving_mode != 1:
                 
                 input_data_dict_eco = cf.prepare_input(speed, temp, 1, road_type, traffic_condition, slope, current_soc)
-                consumption_eco = cf.predict_energy_consumption_local(input_data_dict_eco, model)
+                consumption_eco = cf.predict_energy_consumption_fast(input_data_dict_eco, model)
                 predicted_range_eco, _ = cf.calculate_range_metrics(consumption_eco, current_soc)
                 
                 range_diff = predicted_range_eco - predicted_range_current
@@ -160,3 +194,102 @@ if st.button("Predict Range & Green Impact", key='predict_btn', use_container_wi
             
     else:
         st.error("Model not loaded. Please ensure the model file is accessible.")
+
+
+# --- 8. WHAT-IF SWEEP (Sensitivity Analysis) ---
+st.markdown("---")
+st.subheader("🔬 What-If Sweep")
+
+sweep_labels = {"Speed (km/h)": "speed", "Temperature (°C)": "temp", "Road Slope (%)": "slope", "Driving Mode": "mode"}
+
+with st.expander("Vary one or two inputs across their full range", expanded=False):
+    sweep_col1, sweep_col2 = st.columns(2)
+    x_label = sweep_col1.selectbox("Vary (X axis)", list(sweep_labels.keys()), key='sweep_x')
+    y_label = sweep_col2.selectbox("Second input (optional)", ["None"] + [label for label in sweep_labels if label != x_label], key='sweep_y')
+    run_sweep = st.button("Run Sweep", key='sweep_btn')
+
+    if run_sweep:
+        if model is None:
+            st.error("Model not loaded. Please ensure the model file is accessible.")
+        else:
+            x_param = sweep_labels[x_label]
+            y_param = sweep_labels.get(y_label)
+            base_inputs = {
+                'speed': speed, 'temp': temp, 'mode': driving_mode, 'road': road_type,
+                'traffic': traffic_condition, 'slope': slope, 'battery_state': current_soc,
+            }
+
+            # One batched model call for the whole grid, cached per input combination
+            x_values, y_values, consumption_grid, range_grid = cached_sweep(
+                cf.model_identity(model), tuple(sorted(base_inputs.items())),
+                x_param, 100, y_param, 50, _loaded_model=model,
+            )
+
+            if y_param is None:
+                sweep_df = pd.DataFrame({x_label: x_values, "Approx. Predicted Range (km)": range_grid})
+                st.line_chart(sweep_df, x=x_label, y="Approx. Predicted Range (km)")
+            else:
+                heatmap_df = pd.DataFrame({
+                    'x': np.tile(x_values, len(y_values)),
+                    'y': np.repeat(y_values, len(x_values)),
+                    'range_km': range_grid.ravel(),
+                })
+
+                # Driving mode is categorical; continuous inputs are binned into grid cells
+                x_enc = alt.X('x:O', title=x_label) if x_param == 'mode' else alt.X('x:Q', bin=alt.Bin(maxbins=len(x_values)), title=x_label)
+                y_enc = alt.Y('y:O', title=y_label) if y_param == 'mode' else alt.Y('y:Q', bin=alt.Bin(maxbins=len(y_values)), title=y_label)
+
+                heatmap = alt.Chart(heatmap_df).mark_rect().encode(
+                    x=x_enc,
+                    y=y_enc,
+                    color=alt.Color('mean(range_km):Q', scale=alt.Scale(scheme='greens'), title="Approx. Range (km)"),
+                )
+                st.altair_chart(heatmap, use_container_width=True)
+
+
+# --- 9. CHARGING-STOP PLANNER (Offline, Local Station Store) ---
+st.markdown("---")
+st.subheader("🧭 Charging-Stop Planner")
+
+with st.expander("Plan the fastest charging stops between two places", expanded=False):
+    plan_col1, plan_col2 = st.columns(2)
+    origin_name = plan_col1.text_input("From", "Pune", key='plan_from')
+    destination_name = plan_col2.text_input("To", "Mumbai", key='plan_to')
+    st.caption(f"Uses the sliders above (speed, temperature, mode, road, traffic) and starts at {current_soc}% SOC. "
+               f"Every stop charges to {cf.CHARGE_TO_SOC:.0f}% at {cf.CHARGER_POWER_KW:.0f} kW.")
+
+    if st.button("Plan Trip", key='plan_btn'):
+        if model is None:
+            st.error("Model not loaded. Please ensure the model file is accessible.")
+        else:
+            with st.spinner('Planning charging stops...'):
+                origin_lat, origin_lon, _ = cf.get_coordinates_from_query(origin_name)
+                dest_lat, dest_lon, _ = cf.get_coordinates_from_query(destination_name)
+
+                plan = None
+                if origin_lat is None or dest_lat is None:
+                    st.error(f"Could not find the coordinates for **{origin_name if origin_lat is None else destination_name}**.")
+                else:
+                    try:
+                        plan = cf.plan_charging_stops(origin_lat, origin_lon, dest_lat, dest_lon, current_soc, model,
+                                                      speed=speed, temp=temp, mode=driving_mode, road=road_type,
+                                                      traffic=traffic_condition)
+                    except ValueError: # no local station store
+                        st.warning("No local charging station store found. Run python refresh_stations.py first (see README).")
+
+            if plan is not None and not plan['feasible']:
+                st.warning("No feasible plan: the destination can't be reached with the charging stations in the local store.")
+            elif plan is not None:
+                p_col1, p_col2, p_col3, p_col4 = st.columns(4)
+                p_col1.metric("Charging Stops", len(plan['stops']))
+                p_col2.metric("Total Time", f"{plan['total_time_h']:.1f} h")
+                p_col3.metric("Charging Time", f"{plan['charge_minutes']:.0f} min")
+                p_col4.metric("Arrival SOC", f"{plan['arrival_soc']:.0f} %")
+
+                if len(plan['stops']):
+                    stops = plan['stops']
+                    st.dataframe(stops[['Station_Name', 'arrival_soc', 'departure_soc', 'charge_minutes']].round(1),
+                                 use_container_width=True)
+                    st.map(stops.rename(columns={'lat': 'latitude', 'lon': 'longitude'}), use_container_width=True)
+                else:
+                    st.success("✅ No charging needed: the destination is within range.")
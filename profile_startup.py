@@ -0,0 +1,79 @@
+# profile_startup.py
+# Startup profile for the Streamlit pages: per-module import times of
+# common_functions (from `python -X importtime` in a fresh interpreter),
+# first-use times of the lazily imported dependencies, and model load time.
+#
+# Usage: python profile_startup.py [--top 15] [--skip-model]
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_times(module='common_functions'):
+    """
+    Imports module in a fresh interpreter and returns {direct dependency:
+    cumulative seconds} plus the module's own total.
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True)
+    times, children = {}, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name_field = line.split('|', 2)
+        if not cumulative.strip().isdigit():
+            continue # header line
+        depth = (len(name_field) - len(name_field.lstrip()) - 1) // 2
+        name = name_field.strip()
+        # A module's imports are listed (one level deeper) just before it
+        if depth == 1:
+            children[f"import {name}"] = int(cumulative) / 1e6
+        elif depth == 0:
+            if name == module:
+                times = dict(children, **{f"import {module} (total)": int(cumulative) / 1e6})
+            children = {}
+    return times
+
+
+def print_table(title, times, top):
+    print(f"\n{title}")
+    for stage, seconds in sorted(times.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {stage:<48} {seconds * 1e3:>9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report import and model load times at app startup.")
+    parser.add_argument('--top', type=int, default=15, help="Rows per table")
+    parser.add_argument('--skip-model', action='store_true', help="Do not download/load the model")
+    args = parser.parse_args()
+
+    print_table("Eager imports (fresh interpreter, cumulative):", import_times(), args.top)
+
+    sys.path.insert(0, HERE)
+    os.chdir(HERE)
+    import common_functions as cf
+
+    # First use of each lazy dependency, on top of what is already imported
+    for name, value in vars(cf).copy().items():
+        if isinstance(value, cf.LazyModule):
+            getattr(value, '__name__')
+
+    if not args.skip_model:
+        start = time.perf_counter()
+        try:
+            cf.start_model_warmup().result()
+        except Exception as e:
+            print(f"\nModel warm-up failed: {e}")
+        cf.record_startup('model warm-up (wall)', time.perf_counter() - start)
+
+    print_table("Lazy imports and model load (this process):",
+                {k: v for k, v in cf.startup_profile().items() if k != 'import common_functions'}, args.top)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+# refresh_stations.py
+# Rebuilds the local charging-station store used by find_nearest_charging_stations.
+#
+# Usage:
+#   python refresh_stations.py --bbox 6.5 68.0 35.7 97.5      (download from Overpass)
+#   python refresh_stations.py --from-json overpass_dump.json   (use a cached dump)
+#   python refresh_stations.py --from-json overpass_dump.json --bbox 6.5 68.0 35.7 97.5
+#
+# A dump without --bbox is taken to cover only the extent of its stations.
+
+import argparse
+
+import common_functions as cf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh the offline charging-station store.")
+    parser.add_argument('--bbox', nargs=4, type=float, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                        help="Download all charging stations inside this bounding box (with --from-json: the area the dump covers)")
+    parser.add_argument('--from-json', dest='overpass_json', help="Path to a cached Overpass JSON response")
+    parser.add_argument('--store', default=cf.STATION_STORE_PATH, help="Station store CSV path")
+    args = parser.parse_args()
+    if args.bbox is None and args.overpass_json is None:
+        parser.error("provide --bbox, --from-json, or both")
+
+    count = cf.refresh_station_store(bbox=args.bbox, overpass_json_path=args.overpass_json, store_path=args.store)
+    index = cf.StationIndex.load(args.store)
+    print(f"Wrote {count} stations to {args.store} (age {index.age_hours():.1f} h, covers {index.bbox})")
+
+
+if __name__ == '__main__':
+    main()
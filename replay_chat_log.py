@@ -0,0 +1,48 @@
+# replay_chat_log.py
+# Answers every user prompt of a Smart Assistant chat log offline, with the
+# same response engine as the page (common_functions.respond_to_prompts):
+# one batched model call for all prediction prompts and one geocode/station
+# search per unique location. Writes the replies in prompt order.
+#
+# Usage:
+#   python replay_chat_log.py chats.jsonl responses.jsonl
+#   python replay_chat_log.py prompts.txt responses.jsonl --batch-size 5000
+
+import argparse
+import json
+import sys
+import time
+
+import common_functions as cf
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a chat log through the Smart Assistant response engine.")
+    parser.add_argument('log', help="Chat log: .jsonl, .csv (prompt column) or text (one prompt per line)")
+    parser.add_argument('output', help="Output .jsonl, one reply per prompt")
+    parser.add_argument('--batch-size', type=int, default=10_000, help="Prompts answered per engine call")
+    args = parser.parse_args()
+
+    prompts = list(cf.iter_chat_prompts(args.log))
+    model = cf.load_model_artifact()
+
+    start = time.perf_counter()
+    intents = {}
+    with open(args.output, 'w', encoding='utf-8') as out:
+        for batch_start in range(0, len(prompts), args.batch_size):
+            batch = prompts[batch_start:batch_start + args.batch_size]
+            for prompt, result in zip(batch, cf.respond_to_prompts(batch, loaded_model=model)):
+                intents[result['intent']] = intents.get(result['intent'], 0) + 1
+                out.write(json.dumps({'prompt': prompt, 'intent': result['intent'], 'response': result['response'],
+                                      'location': result['location'], 'nearest': result['nearest']},
+                                     ensure_ascii=False) + "\n")
+    elapsed = time.perf_counter() - start
+
+    print(f"Answered {len(prompts)} prompts in {elapsed:.2f} s "
+          f"({len(prompts) / elapsed if elapsed else 0:,.0f} prompts/s)", file=sys.stderr)
+    for intent, count in sorted(intents.items(), key=lambda item: item[1], reverse=True):
+        print(f"  {intent:<20} {count}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
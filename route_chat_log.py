@@ -0,0 +1,106 @@
+# route_chat_log.py
+# Replays a Smart Assistant chat log through common_functions.route_prompt and
+# writes the intent and slots (speed, soc, slope, mode, road, location) of
+# every user prompt.
+#
+# Usage:
+#   python route_chat_log.py chats.jsonl routes.csv
+#   python route_chat_log.py prompts.txt routes.csv --check   # compare with the original page routing
+
+import argparse
+import re
+import sys
+import time
+
+import common_functions as cf
+
+
+def legacy_route(prompt):
+    """
+    The routing of pages/2_Smart_Assistant.py as it stood before
+    common_functions.route_prompt (handle_doubt_clearing, the inline model
+    features and nearest-station checks, handle_prediction_chat), kept as the
+    reference for --check. Returns the intent plus the slots that intent used.
+    """
+    prompt_lower = prompt.lower()
+
+    # handle_doubt_clearing
+    if any(keyword in prompt_lower for keyword in ["slope", "road slope", "incline", "dhalan"]):
+        return {'intent': 'doubt_slope'}
+    elif any(keyword in prompt_lower for keyword in ["soc", "battery state", "battery percentage", "range"]):
+        return {'intent': 'doubt_soc'}
+    elif any(keyword in prompt_lower for keyword in ["consumption", "kwh/km", "average"]):
+        return {'intent': 'doubt_consumption'}
+    elif any(keyword in prompt_lower for keyword in ["road type", "highway", "urban", "rural"]):
+        return {'intent': 'doubt_road_type'}
+
+    if any(keyword in prompt_lower for keyword in ["model features", "what is this model", "inputs", "dashboard parameters", "what are features"]):
+        return {'intent': 'model_features'}
+
+    if "nearest" in prompt_lower and ("station" in prompt_lower or "charger" in prompt_lower or "map" in prompt_lower):
+        search_query_match = re.search(r'near\s+(.+)', prompt_lower)
+        return {'intent': 'nearest_station', 'location': search_query_match.group(1).strip() if search_query_match else None}
+
+    # handle_prediction_chat
+    if not any(keyword in prompt_lower for keyword in ["predict", "range", "consumption"]):
+        return {'intent': 'fallback'}
+
+    speed_match = re.search(r'(\d+)\s*km/?h|at\s*(\d+)', prompt_lower)
+    battery_match = re.search(r'(\d+)\s*%', prompt_lower)
+    slope_match = re.search(r'slope\s*(\-?\+?\d+\.?\d*)', prompt_lower)
+
+    speed = float(speed_match.group(1) or speed_match.group(2)) if speed_match else 60.0
+    current_soc = float(battery_match.group(1)) if battery_match else 75.0
+    slope = float(slope_match.group(1)) if slope_match else 0.0
+
+    driving_mode = 2
+    if "eco" in prompt_lower: driving_mode = 1
+    elif "sport" in prompt_lower: driving_mode = 3
+
+    road_type = 2
+    if "highway" in prompt_lower: road_type = 1
+    elif "rural" in prompt_lower: road_type = 3
+
+    return {'intent': 'prediction', 'speed': speed, 'soc': current_soc, 'slope': slope,
+            'mode': driving_mode, 'road': road_type}
+
+
+def route_mismatch(route, expected):
+    """True when a route differs from legacy_route in its intent or any slot that intent uses."""
+    return any(route[key] != value for key, value in expected.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route every prompt in a chat log to an intent with slots.")
+    parser.add_argument('log', help="Chat log: .jsonl, .csv (prompt column) or text (one prompt per line)")
+    parser.add_argument('output', nargs='?', help="Output .csv (default: intent counts only)")
+    parser.add_argument('--check', action='store_true', help="Also run the legacy routing and report mismatches")
+    args = parser.parse_args()
+
+    prompts = list(cf.iter_chat_prompts(args.log))
+
+    start = time.perf_counter()
+    routes = cf.route_prompts(prompts)
+    elapsed = time.perf_counter() - start
+    print(f"Routed {len(prompts)} prompts in {elapsed:.3f} s "
+          f"({len(prompts) / elapsed if elapsed else 0:,.0f} prompts/s)", file=sys.stderr)
+    print(routes['intent'].value_counts().to_string(), file=sys.stderr)
+
+    if args.output:
+        routes.insert(0, 'prompt', prompts)
+        routes.to_csv(args.output, index=False)
+
+    if args.check:
+        start = time.perf_counter()
+        expected = [legacy_route(p) for p in prompts]
+        legacy_elapsed = time.perf_counter() - start
+        actual = routes.drop(columns='prompt', errors='ignore').to_dict('records')
+        mismatched = [i for i, (route, reference) in enumerate(zip(actual, expected)) if route_mismatch(route, reference)]
+        print(f"Legacy routing: {legacy_elapsed:.3f} s; {len(mismatched)} mismatching prompts", file=sys.stderr)
+        for i in mismatched[:10]:
+            print(f"  {prompts[i]!r}: {actual[i]} != {expected[i]}", file=sys.stderr)
+        if mismatched:
+            raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
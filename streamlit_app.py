@@ -61,5 +61,8 @@ st.markdown("---")
 st.subheader("Developed by")
 st.markdown("### [Riddhi Bais]")
 
-
-
+# --- 4. Model Warm-up ---
+# Imported last so the welcome page renders first; the model then loads in the
+# background while the user picks a page.
+import common_functions as cf
+cf.start_model_warmup()
@@ -0,0 +1,294 @@
+# telemetry_stream.py
+# Streaming range estimation from live vehicle telemetry (JSON lines).
+# Keeps a fixed-size ring buffer per vehicle, micro-batches the rolling
+# feature vectors of all updated vehicles into one model call, and emits
+# updated range estimates as JSON lines on stdout.
+#
+# Usage:
+#   cat telemetry.jsonl | python telemetry_stream.py --stdin
+#   python telemetry_stream.py --tail /var/log/fleet/telemetry.jsonl
+#   python telemetry_stream.py --listen 127.0.0.1:7070
+#
+# Input line example:
+#   {"vehicle_id": "KA01-1234", "ts": 1700000000, "speed": 62.5, "acceleration": 0.3,
+#    "battery_voltage": 372.1, "battery_temp": 31.0, "soc": 64.2, "slope": 1.5, "mode": 2}
+
+import argparse
+import json
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+import warnings
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import common_functions as cf
+
+# Telemetry field -> prepare_input record key (numeric, averaged over the window)
+TELEMETRY_FIELDS = {
+    'speed': 'Speed_kmh',
+    'acceleration': 'Acceleration_ms2',
+    'battery_voltage': 'Battery_Voltage_V',
+    'battery_temp': 'Battery_Temperature_C',
+    'soc': 'Battery_State_%',
+    'slope': 'Slope_%',
+    'temp': 'Temperature_C',
+    'humidity': 'Humidity_%',
+    'wind_speed': 'Wind_Speed_ms',
+    'tire_pressure': 'Tire_Pressure_psi',
+    'weight': 'Vehicle_Weight_kg',
+}
+# Telemetry field -> categorical record key (latest value wins)
+TELEMETRY_CATEGORIES = {
+    'mode': 'Driving_Mode',
+    'road': 'Road_Type',
+    'traffic': 'Traffic_Condition',
+    'weather': 'Weather_Condition',
+}
+
+# Used until a vehicle reports the field (same values as the dashboard/chat defaults)
+TELEMETRY_DEFAULTS = cf.prepare_input(60.0, 25.0, 2, 2, 2, 0.0, 75.0)
+
+
+class TelemetryWindows:
+    """
+    Ring buffers for up to max_vehicles vehicles in one preallocated array of
+    shape (max_vehicles, window, n_fields), so memory is fixed up front. When
+    full, the least recently seen vehicle's slot is reused.
+    """
+
+    def __init__(self, max_vehicles=10_000, window=30):
+        self.max_vehicles = max_vehicles
+        self.window = window
+        self.fields = list(TELEMETRY_FIELDS)
+        self.field_index = {name: i for i, name in enumerate(self.fields)}
+        self.categories = list(TELEMETRY_CATEGORIES)
+
+        self.values = np.full((max_vehicles, window, len(self.fields)), np.nan, dtype=np.float32)
+        self.latest_category = np.zeros((max_vehicles, len(self.categories)), dtype=np.int8)
+        self.latest_soc = np.full(max_vehicles, np.nan, dtype=np.float32) # last reported, even if outside the window
+        self.position = np.zeros(max_vehicles, dtype=np.int64)
+        self.last_ts = np.zeros(max_vehicles, dtype=np.float64)
+
+        self.slots = OrderedDict() # vehicle_id -> slot, least recently seen first
+        self.free_slots = list(range(max_vehicles - 1, -1, -1))
+        self.evictions = 0
+
+    def slot_for(self, vehicle_id):
+        slot = self.slots.get(vehicle_id)
+        if slot is not None:
+            self.slots.move_to_end(vehicle_id)
+            return slot
+
+        if self.free_slots:
+            slot = self.free_slots.pop()
+        else:
+            _, slot = self.slots.popitem(last=False)
+            self.evictions += 1
+        self.values[slot] = np.nan
+        self.latest_category[slot] = 0
+        self.latest_soc[slot] = np.nan
+        self.position[slot] = 0
+        self.slots[vehicle_id] = slot
+        return slot
+
+    def add(self, message):
+        """
+        Stores one telemetry message; returns the vehicle's slot. The whole
+        message is parsed first, so a rejected one (KeyError, ValueError,
+        TypeError, OverflowError) neither claims nor evicts a slot.
+        """
+        vehicle_id = str(message['vehicle_id'])
+        row = np.full(len(self.fields), np.nan, dtype=np.float32)
+        for name, i in self.field_index.items():
+            value = message.get(name)
+            if value is not None:
+                row[i] = float(value)
+        categories = {}
+        for i, name in enumerate(self.categories):
+            value = message.get(name)
+            if value is not None:
+                categories[i] = np.int8(int(value))
+        ts = float(message.get('ts', time.time()))
+
+        slot = self.slot_for(vehicle_id)
+        self.values[slot, self.position[slot] % self.window] = row
+        if not np.isnan(row[self.field_index['soc']]):
+            self.latest_soc[slot] = row[self.field_index['soc']]
+        self.position[slot] += 1
+        for i, value in categories.items():
+            self.latest_category[slot, i] = value
+        self.last_ts[slot] = ts
+        return slot
+
+    def feature_records(self, slots):
+        """
+        prepare_input-style DataFrame for the given slots: rolling means of
+        the numeric fields (SOC uses the last reported value), latest categoricals,
+        and defaults for anything never reported.
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        windows = self.values[slots]
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', category=RuntimeWarning) # all-NaN columns
+            means = np.nanmean(windows, axis=1)
+
+        # Last reported SOC, not the window average, drives the remaining-energy estimate;
+        # messages without a soc field must not reset it to the default
+        means[:, self.field_index['soc']] = self.latest_soc[slots]
+
+        records = {}
+        for name, key in TELEMETRY_FIELDS.items():
+            column = means[:, self.field_index[name]].astype(np.float64)
+            records[key] = np.where(np.isnan(column), TELEMETRY_DEFAULTS[key], column)
+        for i, (name, key) in enumerate(TELEMETRY_CATEGORIES.items()):
+            column = self.latest_category[slots, i]
+            records[key] = np.where(column == 0, TELEMETRY_DEFAULTS[key], column)
+        records['Distance_Travelled_km'] = np.full(len(slots), TELEMETRY_DEFAULTS['Distance_Travelled_km'])
+        return pd.DataFrame(records)
+
+
+class StreamingRangeEstimator:
+    """Collects updated vehicles and scores them together on flush()."""
+
+    def __init__(self, model, max_vehicles=10_000, window=30):
+        self.model = model
+        self.windows = TelemetryWindows(max_vehicles, window)
+        self.dirty = set()
+        self.messages = 0
+        self.rejected = 0
+
+    def ingest(self, line):
+        try:
+            message = json.loads(line)
+            slot = self.windows.add(message)
+        except (ValueError, KeyError, TypeError, OverflowError):
+            self.rejected += 1
+            return
+        self.dirty.add(slot)
+        self.messages += 1
+
+    def flush(self):
+        """One batched prediction for every vehicle updated since the last flush."""
+        if not self.dirty:
+            return []
+        slots = sorted(self.dirty)
+        self.dirty.clear()
+
+        records = self.windows.feature_records(slots)
+        consumption = cf.predict_energy_consumption_batch(records, self.model)
+        soc = records['Battery_State_%'].to_numpy()
+        predicted_range, co2_saved_kg = cf.calculate_range_metrics_batch(consumption, soc)
+
+        slot_to_vehicle = {slot: vehicle for vehicle, slot in self.windows.slots.items()}
+        return [
+            {
+                'vehicle_id': slot_to_vehicle.get(slot),
+                'ts': float(self.windows.last_ts[slot]),
+                'soc': round(float(s), 2),
+                'consumption_kwh_per_km': round(float(c), 4),
+                'predicted_range_km': round(float(r), 1),
+                'co2_saved_kg': round(float(co2), 2),
+            }
+            for slot, s, c, r, co2 in zip(slots, soc, consumption, predicted_range, co2_saved_kg)
+        ]
+
+
+# --- INPUT SOURCES (each runs in a thread and feeds one bounded queue) ---
+
+def read_stdin(lines):
+    for line in sys.stdin:
+        lines.put(line)
+    lines.put(None)
+
+
+def read_tail(path, lines, poll_seconds=0.2):
+    """Follows a file like `tail -f`, starting at its current end."""
+    with open(path) as f:
+        f.seek(0, os.SEEK_END)
+        while True:
+            line = f.readline()
+            if line:
+                lines.put(line)
+            else:
+                time.sleep(poll_seconds)
+
+
+def read_socket(address, lines):
+    """Accepts any number of TCP clients on address, each sending JSON lines."""
+    host, port = address.rsplit(':', 1)
+    server = socket.create_server((host, int(port)))
+
+    def serve(connection):
+        with connection, connection.makefile('r') as stream:
+            for line in stream:
+                lines.put(line)
+
+    while True:
+        connection, _ = server.accept()
+        threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+
+def run(estimator, lines, flush_interval=1.0, max_batch=50_000, out=sys.stdout):
+    """Drains the queue, flushing every flush_interval seconds or max_batch messages."""
+    next_flush = time.monotonic() + flush_interval
+    pending = 0
+    finished = False
+
+    while not finished:
+        try:
+            line = lines.get(timeout=max(0.0, next_flush - time.monotonic()))
+            if line is None:
+                finished = True
+            elif line.strip():
+                estimator.ingest(line)
+                pending += 1
+        except queue.Empty:
+            pass
+
+        if finished or pending >= max_batch or time.monotonic() >= next_flush:
+            for estimate in estimator.flush():
+                out.write(json.dumps(estimate) + "\n")
+            out.flush()
+            pending = 0
+            next_flush = time.monotonic() + flush_interval
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream telemetry JSON lines into incremental range estimates.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--stdin', action='store_true', help="Read JSON lines from stdin")
+    source.add_argument('--tail', metavar='PATH', help="Follow a JSON-lines file")
+    source.add_argument('--listen', metavar='HOST:PORT', help="Accept JSON lines over TCP")
+    parser.add_argument('--window', type=int, default=30, help="Readings kept per vehicle (ring buffer size)")
+    parser.add_argument('--max-vehicles', type=int, default=10_000, help="Vehicles tracked before LRU eviction")
+    parser.add_argument('--flush-interval', type=float, default=1.0, help="Seconds between micro-batches")
+    args = parser.parse_args()
+
+    estimator = StreamingRangeEstimator(cf.load_model_artifact(), args.max_vehicles, args.window)
+    lines = queue.Queue(maxsize=100_000) # backpressure on readers if scoring falls behind
+
+    if args.stdin:
+        reader = threading.Thread(target=read_stdin, args=(lines,), daemon=True)
+    elif args.tail:
+        reader = threading.Thread(target=read_tail, args=(args.tail, lines), daemon=True)
+    else:
+        reader = threading.Thread(target=read_socket, args=(args.listen, lines), daemon=True)
+    reader.start()
+
+    try:
+        run(estimator, lines, args.flush_interval)
+    except KeyboardInterrupt:
+        pass
+    print(f"Processed {estimator.messages} messages ({estimator.rejected} rejected, "
+          f"{estimator.windows.evictions} evictions)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+# tests/test_flat_forest.py
+# The flat-array backend must reproduce scikit-learn's predictions exactly on
+# random in-range inputs (run: python -m pytest tests).
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+import common_functions as cf
+from fixtures import make_fixture_model, synthetic_records
+
+
+@pytest.fixture(scope='module')
+def forest(tmp_path_factory):
+    path = tmp_path_factory.mktemp('model') / 'fixture_model.pkl'
+    return make_fixture_model(str(path), n_estimators=15, max_depth=12, n_samples=4_000)
+
+
+@pytest.fixture(scope='module')
+def features():
+    return pd.DataFrame(cf.build_feature_matrix(synthetic_records(3_000, seed=1)), columns=cf.FEATURE_NAMES)
+
+
+def test_forest_predictions_are_identical(forest, features):
+    flat = cf.FlatForest.from_model(forest)
+    assert np.array_equal(flat.predict(features.to_numpy()), forest.predict(features))
+
+
+def test_forest_identical_on_random_feature_rows(forest):
+    # Includes out-of-range values and arbitrary dummy combinations
+    assert cf.FlatForest.from_model(forest).max_abs_difference(forest, n_samples=2_000, seed=3) == 0.0
+
+
+def test_forest_identical_across_chunks(forest, features):
+    flat = cf.FlatForest.from_model(forest)
+    assert np.array_equal(flat.predict(features.to_numpy(), chunk_size=257), forest.predict(features))
+
+
+def test_single_tree_predictions_are_identical(forest, features):
+    from sklearn.tree import DecisionTreeRegressor
+
+    tree = DecisionTreeRegressor(max_depth=10, random_state=0).fit(features, forest.predict(features))
+    flat = cf.FlatForest.from_model(tree)
+    assert flat.n_trees == 1
+    assert np.array_equal(flat.predict(features.to_numpy()), tree.predict(features))
+
+
+def test_predict_per_tree_shape_and_values(forest, features):
+    X = features.to_numpy()[:100]
+    per_tree = cf.FlatForest.from_model(forest).predict_per_tree(X)
+    assert per_tree.shape == (len(forest.estimators_), 100)
+    expected = np.stack([estimator.predict(X.astype(np.float32)) for estimator in forest.estimators_])
+    assert np.array_equal(per_tree, expected)
+
+
+def test_saved_and_memory_mapped_forest_matches(forest, features, tmp_path):
+    cf.FlatForest.from_model(forest).save(str(tmp_path))
+    loaded = cf.FlatForest.load(str(tmp_path))
+    assert np.array_equal(loaded.predict(features.to_numpy()), forest.predict(features))
+
+
+def test_exact_package_is_served_from_memory_mapped_arrays(forest, features, tmp_path):
+    pickle_path = str(tmp_path / 'model.pkl')
+    make_fixture_model(pickle_path, n_estimators=15, max_depth=12, n_samples=4_000)
+    manifest = cf.package_model(pickle_path, str(tmp_path / 'package'))
+    assert manifest['flat_forest_max_abs_difference'] == 0.0
+
+    served = cf.load_model_artifact(pickle_path, str(tmp_path / 'package'))
+    assert isinstance(served, cf.FlatForest)
+    assert isinstance(served.threshold, np.memmap)
+    X = features.to_numpy()
+    assert np.array_equal(cf.predict_raw_consumption(X, served), forest.predict(features))